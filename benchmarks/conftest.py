@@ -0,0 +1,35 @@
+"""Options and synthetic data for the pytest-benchmark suite in ``test_throughput.py``.
+
+The synthetic data is written once per session, or reused from
+``--synthetic-workdir`` if it was generated with the same parameters."""
+from pathlib import Path
+import pytest
+
+
+DEFAULTS = {"regions": 3, "products": 12, "extensions": 6, "density": 0.2, "seed": 0}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("synthetic", "synthetic EXIOBASE data for benchmarks")
+    for name, default in DEFAULTS.items():
+        group.addoption(
+            "--synthetic-" + name,
+            type=type(default),
+            default=default,
+            help="synthetic data {} (default: {})".format(name, default),
+        )
+    group.addoption("--synthetic-workdir", type=Path, help="reuse generated data")
+    group.addoption("--synthetic-workers", type=int, default=1)
+
+
+@pytest.fixture(scope="session")
+def synthetic(request, tmp_path_factory):
+    """Get ``(workdir, parameters, workers)`` for the cases of ``throughput.py``"""
+    import throughput
+
+    options = request.config.option
+    parameters = {name: getattr(options, "synthetic_" + name) for name in DEFAULTS}
+    workdir = options.synthetic_workdir or tmp_path_factory.mktemp("synthetic")
+    workdir.mkdir(parents=True, exist_ok=True)
+    throughput.generate(workdir, parameters)
+    return workdir, parameters, options.synthetic_workers
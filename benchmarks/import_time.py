@@ -0,0 +1,79 @@
+"""Import time regression benchmark.
+
+Imports each module in a fresh interpreter, and reports the median import
+time and any heavy dependency which was loaded at import. Exits with an
+error if a heavy dependency is imported eagerly, or if an import is slower
+than ``--max-ms``.
+
+Usage::
+
+    python benchmarks/import_time.py [--repeat 7] [--max-ms 150]
+
+"""
+from pathlib import Path
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+
+MODULES = (
+    "mrio_common_metadata",
+    "mrio_common_metadata.conversion.exiobase_3_hybrid_io",
+    "mrio_common_metadata.conversion.exiobase_3_hybrid_su",
+)
+
+# Only loaded when the functions which need them are called
+HEAVY = ("numpy", "scipy", "pandas", "pyarrow", "pyxlsb", "openpyxl", "tarfile")
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "elapsed": elapsed,
+    "heavy": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+
+def measure(module, repeat):
+    root = Path(__file__).resolve().parent.parent
+    timings, heavy = [], set()
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", SCRIPT.format(module=module, heavy=HEAVY)],
+            cwd=root,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output)
+        timings.append(result["elapsed"] * 1000)
+        heavy.update(result["heavy"])
+    return statistics.median(timings), sorted(heavy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--max-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        median, heavy = measure(module, args.repeat)
+        print("{:<60} {:8.1f} ms".format(module, median))
+        if heavy:
+            print("    eagerly imported: {}".format(", ".join(heavy)))
+            failed = True
+        if median > args.max_ms:
+            print("    slower than {} ms".format(args.max_ms))
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,551 @@
+"""Synthetic EXIOBASE hybrid source files and datapackages.
+
+Writes workbooks with the file names, worksheet names and layouts given in
+``version_config.VERSIONS`` of the hybrid IO and SU converters, filled with
+random data of any size, so conversions and readers can be run without the
+real (multi-GB) EXIOBASE download.
+
+``.xlsb`` workbooks are written with a minimal BIFF12 writer, which only
+writes the records read by ``pyxlsb``; ``.xlsx`` workbooks are written with
+``openpyxl``.
+
+Usage::
+
+    python benchmarks/synthetic.py targetdir [--kind io] [--version "3.3.17 hybrid"]
+        [--regions 5] [--products 40] [--extensions 20] [--density 0.1]
+
+"""
+from pathlib import Path
+import argparse
+import csv
+import itertools
+import json
+import shutil
+import struct
+import tempfile
+import zipfile
+
+
+# Row and column label names used in the headers of numeric worksheets
+ACTIVITY_LABELS = (
+    "Country code",
+    "Activity name",
+    "Activity code 1",
+    "Activity code 2",
+)
+PRODUCT_LABELS = (
+    "Country code",
+    "Product name",
+    "Product code 1",
+    "Product code 2",
+    "Unit",
+)
+FINAL_DEMAND_LABELS = (
+    "Country code",
+    "Final demand category",
+    "Final demand code 1",
+    "Final demand code 2",
+)
+UNITS = ("tonnes", "TJ", "Meuro")
+COMPARTMENTS = ("Air", "Water", "Soil")
+
+
+def get_metadata(
+    kinds, regions=5, products=40, extensions=20, activities=None, final_demand=7
+):
+    """Get synthetic metadata, as dicts with the field names of ``VERSIONS`` mappings.
+
+    ``kinds`` are the extension kinds, and ``extensions`` the number of
+    extensions of each kind. There are ``products``, ``activities`` and
+    ``final_demand`` categories in each of the ``regions``."""
+    if activities is None:
+        activities = products
+    locations = [
+        {"code": "R{:02}".format(i + 1), "name": "Region {}".format(i + 1)}
+        for i in range(regions)
+    ]
+    return {
+        "locations": locations,
+        "products": [
+            {
+                "location": location["code"],
+                "name": "Product {}".format(i + 1),
+                "code 1": "p{:03}".format(i + 1),
+                "code 2": "P.{:03}".format(i + 1),
+                "unit": UNITS[i % len(UNITS)],
+            }
+            for location in locations
+            for i in range(products)
+        ],
+        "activities": [
+            {
+                "location": location["code"],
+                "name": "Activity {}".format(i + 1),
+                "code 1": "a{:03}".format(i + 1),
+                "code 2": "A.{:03}".format(i + 1),
+            }
+            for location in locations
+            for i in range(activities)
+        ],
+        "final demand": [
+            {
+                "location": location["code"],
+                "name": "Final demand {}".format(i + 1),
+                "code 1": "f{:03}".format(i + 1),
+                "code 2": "F.{:03}".format(i + 1),
+            }
+            for location in locations
+            for i in range(final_demand)
+        ],
+        "extensions": [
+            {
+                "name": "{} {}".format(kind.replace("_", " ").capitalize(), i + 1),
+                "unit": UNITS[i % len(UNITS)],
+                "compartment": COMPARTMENTS[i % 3] if kind == "emission" else None,
+                "kind": kind,
+            }
+            for kind in kinds
+            for i in range(extensions)
+        ],
+    }
+
+
+def iterate_values(rng, rows, cols, density, scale=1.0):
+    """Iterate over ``rows`` random NumPy rows of length ``cols``.
+
+    A share ``density`` of the cells is non-zero, with values between 0 and
+    ``scale``."""
+    for _ in range(rows):
+        values = rng.random(cols) * scale
+        values[rng.random(cols) >= density] = 0
+        yield values
+
+
+def iterate_labelled_rows(labels, values, label_fields):
+    """Prepend the ``label_fields`` of each of the ``labels`` to rows of ``values``"""
+    for label, row in zip(labels, values):
+        yield [label[field] for field in label_fields] + row.tolist()
+
+
+def get_header_rows(
+    cols, label_names, width, fields=("location", "name", "code 1", "code 2")
+):
+    """Get the header rows of a worksheet with ``width`` row label columns.
+
+    Each header row is filled up with empty cells, except for the last row
+    label column, which holds the name of the column label."""
+    return [
+        [None] * (width - 1) + [name] + [col[field] for col in cols]
+        for name, field in zip(label_names, fields)
+    ]
+
+
+def write_xlsx(filepath, sheets):
+    """Write ``[(worksheet, rows)]`` to a new ``.xlsx`` workbook"""
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    for name, rows in sheets:
+        sheet = workbook.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(filepath)
+
+
+def _record(recid, payload=b""):
+    """Encode a BIFF12 record: a one or two byte id, a variable length size, and data"""
+    header = recid.to_bytes(1 if recid < 0x80 else 2, "little")
+    size = len(payload)
+    while True:
+        byte, size = size & 0x7F, size >> 7
+        header += bytes([byte | (0x80 if size else 0)])
+        if not size:
+            return header + payload
+
+
+def _string(value):
+    return struct.pack("<I", len(value)) + value.encode("utf-16-le")
+
+
+def _write_worksheet(f, rows, strings):
+    """Write the records of one worksheet to the binary file ``f``.
+
+    Cells are written to a temporary file first, as the dimension record at
+    the start of the worksheet needs the number of rows and columns. Strings
+    are added to the shared ``strings`` table, and empty and zero cells are
+    not written at all."""
+    pack_row = struct.Struct("<BBI").pack
+    pack_float = struct.Struct("<BBIId").pack
+    pack_string = struct.Struct("<BBIII").pack
+    width = height = 0
+
+    with tempfile.TemporaryFile() as cells:
+        for r, row in enumerate(rows):
+            cells.write(pack_row(0x00, 4, r))
+            for c, value in enumerate(row):
+                if isinstance(value, str):
+                    index = strings.setdefault(value, len(strings))
+                    cells.write(pack_string(0x07, 12, c, 0, index))
+                elif value:
+                    cells.write(pack_float(0x05, 16, c, 0, value))
+            width, height = max(width, len(row)), r + 1
+
+        f.write(_record(0x0181))  # worksheet
+        f.write(_record(0x0194, struct.pack("<IIII", 0, height - 1, 0, width - 1)))
+        f.write(_record(0x0191))  # sheet data
+        cells.seek(0)
+        shutil.copyfileobj(cells, f)
+        f.write(_record(0x0192))  # end of sheet data
+        f.write(_record(0x0182))  # end of worksheet
+
+
+def write_xlsb(filepath, sheets):
+    """Write ``[(worksheet, rows)]`` to a new ``.xlsb`` workbook.
+
+    Cell values are strings, numbers or ``None``. Only the records needed by
+    ``pyxlsb`` are written, and the rows of each worksheet are streamed, so
+    worksheets of any size can be written."""
+    strings, relationships, workbook = {}, [], [_record(0x0183), _record(0x018F)]
+
+    with zipfile.ZipFile(filepath, "w", zipfile.ZIP_DEFLATED) as zf:
+        for index, (name, rows) in enumerate(sheets, start=1):
+            target = "worksheets/sheet{}.bin".format(index)
+            with zf.open("xl/" + target, "w", force_zip64=True) as f:
+                _write_worksheet(f, rows, strings)
+            relationships.append(
+                '<Relationship Id="rId{}" Target="{}"/>'.format(index, target)
+            )
+            workbook.append(
+                _record(
+                    0x019C,
+                    struct.pack("<II", 0, index)
+                    + _string("rId{}".format(index))
+                    + _string(name),
+                )
+            )
+        workbook.extend((_record(0x0190), _record(0x0184)))
+        zf.writestr("xl/workbook.bin", b"".join(workbook))
+        zf.writestr(
+            "xl/_rels/workbook.bin.rels",
+            "<Relationships>{}</Relationships>".format("".join(relationships)),
+        )
+        zf.writestr(
+            "xl/sharedStrings.bin",
+            _record(0x019F, struct.pack("<II", len(strings), len(strings)))
+            + b"".join(_record(0x0013, b"\x00" + _string(s)) for s in strings)
+            + _record(0x01A0),
+        )
+
+
+def write_csv(filepath, sheets):
+    """Write the rows of a single worksheet to a ``.csv`` file"""
+    ((_, rows),) = sheets
+    with open(filepath, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+
+
+def write_workbooks(sourcedir, workbooks):
+    """Write ``{filename: [(worksheet, rows)]}``, choosing writers by file extension"""
+    writers = {".xlsb": write_xlsb, ".xlsx": write_xlsx, ".csv": write_csv}
+    for filename, sheets in workbooks.items():
+        writers[Path(filename).suffix](Path(sourcedir) / filename, sheets)
+
+
+def add_nomenclature(workbooks, config, metadata):
+    """Add the nomenclature worksheets of a version ``config`` to ``workbooks``.
+
+    The first row of each worksheet holds the column names of the ``mapping``,
+    and the other rows the mapped fields of the metadata."""
+    for kind, objs in config["nomenclature"].items():
+        for obj in objs:
+            records = metadata[kind]
+            if kind == "extensions":
+                records = [r for r in records if r["kind"] == obj["kind"]]
+            rows = [list(obj["mapping"])] + [
+                [record[field] for field in obj["mapping"].values()]
+                for record in records
+            ]
+            workbooks.setdefault(obj["filename"], []).append((obj["worksheet"], rows))
+
+
+def add_matrix(
+    workbooks, obj, rows, cols, values, label_fields, col_labels=ACTIVITY_LABELS
+):
+    """Add a worksheet with labelled rows and columns to ``workbooks``.
+
+    The first rows are the labels of ``cols``, and the first columns of the
+    other rows the ``label_fields`` of ``rows``."""
+    width = len(label_fields)
+    sheet = get_header_rows(cols, col_labels, width)
+    body = iterate_labelled_rows(rows, values, label_fields)
+    workbooks.setdefault(obj["filename"], []).append(
+        (obj["worksheet"], itertools.chain(sheet, body))
+    )
+
+
+def get_extension_fields(kind):
+    """Row label columns of an extension worksheet; emissions also have a compartment"""
+    return ("name", "unit", "compartment") if kind == "emission" else ("name", "unit")
+
+
+def generate_io_sources(
+    sourcedir,
+    version="3.3.17 hybrid",
+    regions=5,
+    products=40,
+    extensions=20,
+    density=0.1,
+    seed=0,
+):
+    """Write synthetic hybrid IO source files for ``version`` to ``sourcedir``.
+
+    There are ``products`` products and activities in each of the ``regions``,
+    and ``extensions`` extensions of each kind. A share ``density`` of the
+    technosphere and extension cells is non-zero. Production is large enough
+    that the technosphere coefficients of each activity add up to less than
+    one. Returns the metadata."""
+    import numpy as np
+
+    from mrio_common_metadata.conversion.exiobase_3_hybrid_io.version_config import (
+        VERSIONS,
+    )
+
+    config = VERSIONS[version]
+    kinds = [obj["kind"] for obj in config["nomenclature"]["extensions"]]
+    metadata = get_metadata(kinds, regions, products, extensions)
+    rng = np.random.default_rng(seed)
+    size = regions * products
+    Path(sourcedir).mkdir(parents=True, exist_ok=True)
+
+    workbooks = {}
+    add_nomenclature(workbooks, config, metadata)
+    add_matrix(
+        workbooks,
+        config["technosphere"],
+        metadata["products"],
+        metadata["activities"],
+        iterate_values(rng, size, size, density),
+        ("location", "name", "code 1", "code 2", "unit"),
+    )
+
+    # Principal production: one row of values below the activity and product labels
+    production = rng.uniform(2 * size, 4 * size, size).tolist()
+    header = get_header_rows(metadata["activities"], ACTIVITY_LABELS, 1)
+    header += get_header_rows(
+        metadata["products"],
+        PRODUCT_LABELS[1:],
+        1,
+        ("name", "code 1", "code 2", "unit"),
+    )
+    workbooks.setdefault(config["production"]["filename"], []).append(
+        (
+            config["production"].get("worksheet"),
+            header + [["Principal production"] + production],
+        )
+    )
+
+    for kind in kinds:
+        fields = get_extension_fields(kind)
+        add_matrix(
+            workbooks,
+            config["biosphere"][kind],
+            [e for e in metadata["extensions"] if e["kind"] == kind],
+            metadata["activities"],
+            iterate_values(rng, extensions, size, density),
+            fields,
+        )
+
+    write_workbooks(sourcedir, workbooks)
+    return metadata
+
+
+def generate_su_sources(
+    sourcedir,
+    version="3.3.17 hybrid",
+    regions=5,
+    products=40,
+    extensions=20,
+    density=0.1,
+    activities=None,
+    final_demand=7,
+    seed=0,
+):
+    """Write synthetic hybrid SU source files for ``version`` to ``sourcedir``.
+
+    Like ``generate_io_sources``, but the number of ``activities`` per region
+    can differ from the number of products. Each activity supplies its
+    principal product, plus random by-products. Final demand and stock to
+    waste have ``final_demand`` categories per region, as do the columns of
+    extension worksheets ending with ``FD``. Returns the metadata."""
+    import numpy as np
+
+    from mrio_common_metadata.conversion.exiobase_3_hybrid_su.version_config import (
+        VERSIONS,
+    )
+
+    config = VERSIONS[version]
+    kinds = [obj["kind"] for obj in config["nomenclature"]["extensions"]]
+    metadata = get_metadata(
+        kinds, regions, products, extensions, activities, final_demand
+    )
+    rng = np.random.default_rng(seed)
+    product_fields = ("location", "name", "code 1", "code 2", "unit")
+    Path(sourcedir).mkdir(parents=True, exist_ok=True)
+
+    def principal_supply(values):
+        # product ``i`` of each region is the principal product of activity ``i``
+        per_region = len(metadata["activities"]) // regions
+        for index, row in enumerate(values):
+            region, product = divmod(index, products)
+            if product < per_region:
+                row[region * per_region + product] = rng.uniform(2, 4) * products
+            yield row
+
+    workbooks = {}
+    add_nomenclature(workbooks, config, metadata)
+    shapes = {
+        "supply": (metadata["activities"], ACTIVITY_LABELS),
+        "use": (metadata["activities"], ACTIVITY_LABELS),
+        "final demand": (metadata["final demand"], FINAL_DEMAND_LABELS),
+        "stock to waste": (metadata["final demand"], FINAL_DEMAND_LABELS),
+    }
+    for name, (cols, labels) in shapes.items():
+        values = iterate_values(rng, len(metadata["products"]), len(cols), density)
+        if name == "supply":
+            values = principal_supply(values)
+        add_matrix(
+            workbooks,
+            config[name],
+            metadata["products"],
+            cols,
+            values,
+            product_fields,
+            labels,
+        )
+
+    for obj in config["biosphere"].values():
+        if obj["worksheet"].lower().endswith("fd"):
+            cols, labels = metadata["final demand"], FINAL_DEMAND_LABELS
+        else:
+            cols, labels = metadata["activities"], ACTIVITY_LABELS
+        rows = [e for e in metadata["extensions"] if e["kind"] == obj["type"]]
+        add_matrix(
+            workbooks,
+            obj,
+            rows,
+            cols,
+            iterate_values(rng, len(rows), len(cols), density),
+            get_extension_fields(obj["type"]),
+            labels,
+        )
+
+    write_workbooks(sourcedir, workbooks)
+    return metadata
+
+
+def generate_datapackage(
+    targetdir,
+    regions=5,
+    products=40,
+    extensions=20,
+    density=0.1,
+    seed=0,
+    compression="bz2",
+    output_format="csv",
+):
+    """Write a synthetic hybrid IO datapackage to ``targetdir``, without source files.
+
+    The resources have the same format as the output of the hybrid IO
+    ``convert_exiobase`` for ``.xlsb`` sources, with sparse ``hiot``
+    triples. Returns ``targetdir``."""
+    import numpy as np
+
+    from mrio_common_metadata.conversion.exiobase_3_hybrid_io import (
+        get_datapackage,
+        write_resource,
+    )
+
+    kinds = ("resource", "land_use", "emission")
+    metadata = get_metadata(kinds, regions, products, extensions)
+    rng = np.random.default_rng(seed)
+    size = regions * products
+    targetdir = Path(targetdir)
+    targetdir.mkdir(parents=True, exist_ok=True)
+
+    def with_id(record):
+        return ("{}-{}".format(record["location"], record["name"]),) + tuple(
+            record.values()
+        )
+
+    products_ = [with_id(record) for record in metadata["products"]]
+    activities = [with_id(record) for record in metadata["activities"]]
+    resources = {
+        "locations": [tuple(record.values()) for record in metadata["locations"]],
+        "products": products_,
+        "activities": activities,
+        "extensions": [
+            ("{}-{}".format(record["kind"], record["name"]),) + tuple(record.values())
+            for record in metadata["extensions"]
+        ],
+    }
+
+    def triples(rows, values):
+        for row, row_values in zip(rows, values):
+            for col in np.flatnonzero(row_values).tolist():
+                yield row[0], activities[col][0], row_values[col]
+
+    resources["hiot"] = triples(products_, iterate_values(rng, size, size, density))
+    resources["production-exchanges"] = (
+        (product[0], activity[0], value)
+        for product, activity, value in zip(
+            products_, activities, rng.uniform(2 * size, 4 * size, size).tolist()
+        )
+    )
+    resources["extension-exchanges"] = triples(
+        resources["extensions"],
+        iterate_values(rng, len(resources["extensions"]), size, density),
+    )
+
+    for name, data in resources.items():
+        write_resource(
+            targetdir, name, data, output_format, compression=compression
+        )
+    with open(targetdir / "datapackage.json", "w") as f:
+        json.dump(
+            get_datapackage(targetdir, compression, output_format),
+            f,
+            indent=2,
+            ensure_ascii=False,
+        )
+    return targetdir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("targetdir", type=Path)
+    parser.add_argument("--kind", choices=("io", "su", "datapackage"), default="io")
+    parser.add_argument("--version", default="3.3.17 hybrid")
+    parser.add_argument("--regions", type=int, default=5)
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--extensions", type=int, default=20)
+    parser.add_argument("--density", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = {
+        "regions": args.regions,
+        "products": args.products,
+        "extensions": args.extensions,
+        "density": args.density,
+        "seed": args.seed,
+    }
+    if args.kind == "io":
+        generate_io_sources(args.targetdir, args.version, **sizes)
+    elif args.kind == "su":
+        generate_su_sources(args.targetdir, args.version, **sizes)
+    else:
+        generate_datapackage(args.targetdir, **sizes)
+
+
+if __name__ == "__main__":
+    main()
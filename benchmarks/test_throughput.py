@@ -0,0 +1,53 @@
+"""pytest-benchmark suite for the cases of ``throughput.py``.
+
+Usage::
+
+    pytest benchmarks [--synthetic-regions 5] [--synthetic-products 40]
+        [--benchmark-autosave] [--benchmark-compare]
+        [--benchmark-compare-fail=median:25%]
+
+Each round runs in a new scratch directory, which is prepared outside of
+the timing. The throughput of each case, and its peak resident memory in
+bytes (``peak_rss``, the maximum over all rounds), are stored in
+``extra_info``. The peak is reset before each round on Linux; elsewhere, it
+is the peak of the whole test process."""
+import itertools
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from mrio_common_metadata.conversion.instrumentation import (
+    get_peak_memory,
+    reset_peak_memory,
+)
+from throughput import CASES
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_throughput(name, synthetic, benchmark, tmp_path):
+    workdir, parameters, workers = synthetic
+    scratches = itertools.count()
+    counts, peaks = [], []
+
+    def setup():
+        scratch = tmp_path / str(next(scratches))
+        scratch.mkdir()
+        run, count, unit = CASES[name](workdir, scratch, parameters, workers)
+        counts.append((count, unit))
+        reset_peak_memory()
+        return (run,), {}
+
+    def target(run):
+        run()
+        peaks.append(get_peak_memory())
+
+    benchmark.pedantic(target, setup=setup, rounds=3)
+    if None not in peaks:
+        benchmark.extra_info["peak_rss"] = max(peaks)
+
+    # ``stats`` is ``None`` with ``--benchmark-disable``
+    if benchmark.stats is not None:
+        count, unit = counts[-1]
+        count = count() if callable(count) else count
+        benchmark.extra_info["unit"] = unit
+        benchmark.extra_info["throughput"] = count / benchmark.stats.stats.median
@@ -0,0 +1,306 @@
+"""Throughput, peak memory and regression benchmarks on synthetic data.
+
+Generates synthetic EXIOBASE hybrid IO and SU source files and a datapackage with
+``synthetic.py``, and runs each benchmark case in a fresh interpreter.
+Reports the median time, throughput and peak resident memory of each case.
+Results can be saved with ``--save``; with ``--baseline``, exits with an
+error if a case is slower, or uses more memory, than the saved results by
+more than ``--tolerance``. The same cases run as a pytest-benchmark suite
+with ``pytest benchmarks`` (see ``test_throughput.py``).
+
+Usage::
+
+    python benchmarks/throughput.py [--regions 5] [--products 40]
+        [--extensions 20] [--density 0.1] [--repeat 3] [--workers 1]
+        [--case NAME ...] [--workdir DIR] [--save FILE] [--baseline FILE]
+        [--tolerance 0.25]
+
+"""
+from pathlib import Path
+import argparse
+import json
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Make the package importable when this script is run from a source checkout
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import synthetic
+
+
+IO_VERSIONS = ("3.3.17 hybrid", "3.3.18 hybrid")
+PARAMETERS = ("regions", "products", "extensions", "density", "seed")
+# Directories written by ``generate`` in the working directory
+GENERATED = ("io-3.3.17", "io-3.3.18", "su-3.3.17", "datapackage")
+SU_VERSION = "3.3.17 hybrid"
+
+
+def get_sourcedir(workdir, version, kind="io"):
+    return workdir / "{}-{}".format(kind, version.split()[0])
+
+
+def generate(workdir, parameters):
+    """Write the synthetic source files and datapackage, unless they already exist"""
+    filepath = workdir / "parameters.json"
+    if filepath.is_file() and json.loads(filepath.read_text()) == parameters:
+        return
+    for name in GENERATED:
+        shutil.rmtree(workdir / name, ignore_errors=True)
+    for version in IO_VERSIONS:
+        synthetic.generate_io_sources(
+            get_sourcedir(workdir, version), version, **parameters
+        )
+    synthetic.generate_su_sources(
+        get_sourcedir(workdir, SU_VERSION, "su"), SU_VERSION, **parameters
+    )
+    synthetic.generate_datapackage(workdir / "datapackage", **parameters)
+    filepath.write_text(json.dumps(parameters))
+
+
+def count_source_cells(parameters):
+    """Number of numeric cells in the technosphere, production and extension sheets"""
+    size = parameters["regions"] * parameters["products"]
+    return size * (size + 1 + 3 * parameters["extensions"])
+
+
+def count_su_source_cells(parameters):
+    """Number of numeric cells in the SU tables and extension sheets"""
+    from mrio_common_metadata.conversion.exiobase_3_hybrid_su import (
+        is_final_demand_worksheet,
+    )
+    from mrio_common_metadata.conversion.exiobase_3_hybrid_su.version_config import (
+        VERSIONS,
+    )
+
+    # As generated by ``synthetic.generate_su_sources``: one activity per
+    # product, and seven final demand categories in each region
+    size = parameters["regions"] * parameters["products"]
+    categories = parameters["regions"] * 7
+    extensions = sum(
+        categories if is_final_demand_worksheet(obj) else size
+        for obj in VERSIONS[SU_VERSION]["biosphere"].values()
+    )
+    return size * 2 * (size + categories) + parameters["extensions"] * extensions
+
+
+def convert_io(version):
+    def case(workdir, scratch, parameters, workers):
+        from mrio_common_metadata.conversion.exiobase_3_hybrid_io import (
+            convert_exiobase,
+        )
+
+        def run():
+            convert_exiobase(
+                get_sourcedir(workdir, version),
+                scratch,
+                version,
+                workers=workers,
+                resume=False,
+            )
+
+        return run, count_source_cells(parameters), "cells"
+
+    return case
+
+
+def convert_su(workdir, scratch, parameters, workers):
+    from mrio_common_metadata.conversion.exiobase_3_hybrid_su import convert_exiobase
+
+    def run():
+        convert_exiobase(
+            get_sourcedir(workdir, SU_VERSION, "su"),
+            scratch,
+            SU_VERSION,
+            workers=workers,
+            resume=False,
+        )
+
+    return run, count_su_source_cells(parameters), "cells"
+
+
+def read_metadata(workdir, scratch, parameters, workers):
+    from mrio_common_metadata import clear_cache, get_metadata_resource
+
+    dirpath = workdir / "datapackage"
+    names = ("extensions", "products", "activities", "locations")
+    counts = []
+
+    def run():
+        # Measure parsing, not the in-memory cache
+        clear_cache()
+        counts.extend(len(get_metadata_resource(dirpath, name)) for name in names)
+
+    return run, lambda: sum(counts), "rows"
+
+
+def read_numeric(workdir, scratch, parameters, workers):
+    from mrio_common_metadata import get_numeric_data_iterator
+
+    dirpath = workdir / "datapackage"
+    names = ("hiot", "extension-exchanges", "production-exchanges")
+    counts = []
+
+    def run():
+        for name in names:
+            iterator = get_numeric_data_iterator(dirpath, name, workers=workers)
+            counts.append(sum(1 for _ in iterator))
+
+    return run, lambda: sum(counts), "values"
+
+
+def package(workdir, scratch, parameters, workers):
+    from mrio_common_metadata.conversion.exiobase_3_hybrid_io import package_exiobase
+
+    size = 0
+    for pth in (workdir / "datapackage").iterdir():
+        if pth.name != "datapackage.json":
+            shutil.copy(pth, scratch)
+            size += pth.stat().st_size
+
+    def run():
+        package_exiobase(scratch, "3.3.17 hybrid")
+
+    return run, size / 1e6, "MB"
+
+
+CASES = {
+    "convert_exiobase io 3.3.17": convert_io("3.3.17 hybrid"),
+    "convert_exiobase io 3.3.18": convert_io("3.3.18 hybrid"),
+    "convert_exiobase su 3.3.17": convert_su,
+    "get_metadata_resource": read_metadata,
+    "get_numeric_data_iterator": read_numeric,
+    "package_exiobase": package,
+}
+
+
+def run_case(name, workdir, workers):
+    """Run one case in this process, and print its results as JSON"""
+    # Import time is measured by ``import_time.py``, not here
+    import numpy, openpyxl, pandas, pyxlsb, scipy.sparse
+
+    parameters = json.loads((workdir / "parameters.json").read_text())
+    with tempfile.TemporaryDirectory(dir=workdir) as scratch:
+        run, count, unit = CASES[name](workdir, Path(scratch), parameters, workers)
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+    # ``ru_maxrss`` is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        json.dumps(
+            {
+                "elapsed": elapsed,
+                "count": count() if callable(count) else count,
+                "unit": unit,
+                "peak_rss_mib": peak_rss,
+            }
+        )
+    )
+
+
+def measure(name, workdir, workers, repeat):
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--run-case",
+                name,
+                "--workdir",
+                str(workdir),
+                "--workers",
+                str(workers),
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    elapsed = statistics.median(run["elapsed"] for run in runs)
+    return {
+        "elapsed": elapsed,
+        "throughput": runs[0]["count"] / elapsed,
+        "unit": runs[0]["unit"],
+        "peak_rss_mib": max(run["peak_rss_mib"] for run in runs),
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    """Compare ``results`` to ``baseline``, and return a list of messages"""
+    if results["parameters"] != baseline["parameters"]:
+        return ["baseline was measured with different parameters"]
+    messages = []
+    for name, result in results["cases"].items():
+        previous = baseline["cases"].get(name)
+        if previous is None:
+            continue
+        for key, label in (("elapsed", "time"), ("peak_rss_mib", "peak memory")):
+            if result[key] > previous[key] * (1 + tolerance):
+                messages.append(
+                    "{}: {} {:.3g} vs. {:.3g} in baseline".format(
+                        name, label, result[key], previous[key]
+                    )
+                )
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--regions", type=int, default=5)
+    parser.add_argument("--products", type=int, default=40)
+    parser.add_argument("--extensions", type=int, default=20)
+    parser.add_argument("--density", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--case", action="append", choices=sorted(CASES))
+    parser.add_argument("--workdir", type=Path)
+    parser.add_argument("--save", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        run_case(args.run_case, args.workdir, args.workers)
+        return
+
+    parameters = {name: getattr(args, name) for name in PARAMETERS}
+    with tempfile.TemporaryDirectory() as tempdir:
+        workdir = args.workdir or Path(tempdir)
+        workdir.mkdir(parents=True, exist_ok=True)
+        generate(workdir, parameters)
+
+        results = {"parameters": parameters, "cases": {}}
+        for name in args.case or CASES:
+            result = measure(name, workdir, args.workers, args.repeat)
+            results["cases"][name] = result
+            print(
+                "{:<32} {:9.3f} s {:>14,.0f} {}/s {:9.1f} MiB peak".format(
+                    name,
+                    result["elapsed"],
+                    result["throughput"],
+                    result["unit"],
+                    result["peak_rss_mib"],
+                )
+            )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            messages = find_regressions(results, json.load(f), args.tolerance)
+        for message in messages:
+            print("Regression: " + message)
+        sys.exit(1 if messages else 0)
+
+
+if __name__ == "__main__":
+    main()
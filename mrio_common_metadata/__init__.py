@@ -1,21 +1,65 @@
 from .version import version as __version__
 
-__all__ = ("get_metadata_resource", "get_numeric_data_iterator", "list_resources")
-
-from .utils import load_compressed_csv, iterate_compressed_csv
+__all__ = (
+    "clear_cache",
+    "get_metadata_resource",
+    "get_column",
+    "get_dense_matrix",
+    "get_leontief_model",
+    "get_metadata_records",
+    "get_numeric_data_chunks",
+    "get_numeric_data_iterator",
+    "get_row",
+    "get_sparse_matrix",
+    "get_supply_use_tables",
+    "get_table",
+    "list_resources",
+)
+
+from .cache import (
+    clear_cache,
+    iterate_array_chunks,
+    load_cached_arrays,
+    load_cached_index,
+    load_descriptor,
+    load_metadata_positions,
+    load_metadata_records,
+    load_metadata_rows,
+    save_cached_arrays,
+    write_cached_arrays,
+    write_cached_index,
+)
+from .archive import TarPackage
+from .calculation import LeontiefModel
+from .utils import (
+    get_resource_compression,
+    iterate_compressed_csv_as_arrays,
+    load_compressed_csv_as_arrays,
+    load_dense_matrix,
+    load_matrix_as_arrays,
+    load_parquet,
+    load_parquet_as_arrays,
+    load_sparse_matrix,
+)
 from pathlib import Path
-import json
 
 
 def _get_valid_dirpath(dirpath):
-    dirpath = Path(dirpath)
+    """Get the datapackage directory, or a ``TarPackage`` if ``dirpath`` is a tar file.
+
+    Tar archives written by ``package_exiobase`` are read in place, without
+    extracting them."""
+    if not isinstance(dirpath, TarPackage):
+        dirpath = Path(dirpath)
+        if dirpath.is_file():
+            dirpath = TarPackage(dirpath)
     assert (dirpath / "datapackage.json").is_file()
     return dirpath
 
 
 def _get_resources(dirpath):
     dirpath = _get_valid_dirpath(dirpath)
-    return json.load(open(dirpath / "datapackage.json"))["resources"]
+    return load_descriptor(dirpath)["resources"]
 
 
 def _get_resource(dirpath, resource_name):
@@ -32,41 +76,375 @@ def _get_foreign_key(dirpath, resource, field):
     )
 
 
+def _get_foreign_key_data(dirpath, resource):
+    """Get id field names and metadata records for the rows and columns of ``resource``"""
+    assert len(resource["foreignKeys"]) == 2
+
+    row_id_field, row_resource = _get_foreign_key(
+        dirpath, resource, resource["schema"]["fields"][0]["name"]
+    )
+    col_id_field, col_resource = _get_foreign_key(
+        dirpath, resource, resource["schema"]["fields"][1]["name"]
+    )
+    return (
+        row_id_field,
+        get_metadata_resource(dirpath, row_resource["name"]),
+        col_id_field,
+        get_metadata_resource(dirpath, col_resource["name"]),
+    )
+
+
+def _get_foreign_key_positions(dirpath, resource):
+    """Get ``{id: position}`` for the rows and columns of ``resource``"""
+    assert len(resource["foreignKeys"]) == 2
+    positions = []
+    for field in resource["schema"]["fields"][:2]:
+        id_field, reference = _get_foreign_key(dirpath, resource, field["name"])
+        positions.append(load_metadata_positions(dirpath, reference, id_field))
+    return positions
+
+
+def _get_numeric_arrays(
+    dirpath, resource, row_index, col_index, cache=False, workers=1
+):
+    """Get row indices, column indices, and values of a numeric resource"""
+    if resource["format"] == "parquet":
+        return load_parquet_as_arrays(dirpath / resource["path"], row_index, col_index)
+    elif resource["format"] in ("npy", "npz"):
+        return load_matrix_as_arrays(dirpath / resource["path"])
+
+    arrays = load_cached_arrays(dirpath, resource) if cache else None
+    if arrays is None and cache:
+        arrays = write_cached_arrays(dirpath, resource, row_index, col_index, workers)
+    elif arrays is None:
+        arrays = load_compressed_csv_as_arrays(
+            dirpath / resource["path"],
+            row_index,
+            col_index,
+            workers,
+            get_resource_compression(resource),
+        )
+    return arrays
+
+
 def list_resources(dirpath):
+    """List the resource names of a datapackage directory or tar archive"""
     return [resource["name"] for resource in _get_resources(dirpath)]
 
 
 def get_metadata_resource(dirpath, resource_name):
+    dirpath = _get_valid_dirpath(dirpath)
     resource = _get_resource(dirpath, resource_name)
     names = [f["name"] for f in resource["schema"]["fields"]]
-    data = load_compressed_csv(Path(dirpath) / resource["path"])
+    data = load_metadata_rows(dirpath, resource)
     return [dict(zip(names, row)) for row in data]
 
 
-def get_numeric_data_iterator(dirpath, resource_name):
+def get_metadata_records(dirpath, resource_name):
+    """Get the records of a metadata resource as a tuple of named tuples.
+
+    Unlike the dictionaries of ``get_metadata_resource``, the records are
+    built once and shared between calls, so they shouldn't be modified.
+    Field names are turned into identifiers, e.g. ``record.code_1``. The
+    position of a record is its code in ``get_numeric_data_iterator(...,
+    codes=True)``."""
+    dirpath = _get_valid_dirpath(dirpath)
+    return load_metadata_records(dirpath, _get_resource(dirpath, resource_name))
+
+
+def get_numeric_data_chunks(
+    dirpath, resource_name, cache=False, workers=1, chunksize=2 ** 16
+):
+    """Iterate over chunks of ``(row codes, column codes, values)`` NumPy arrays.
+
+    The codes are integer positions in the foreign key resources, like in
+    ``get_numeric_data_iterator(..., codes=True)``. CSV resources are parsed
+    in bulk, one chunk of at most ``chunksize`` values at a time, without a
+    Python ``float`` or tuple per value. ``cache`` and ``workers`` are used
+    as in ``get_numeric_data_iterator``."""
+    dirpath = _get_valid_dirpath(dirpath)
     resource = _get_resource(dirpath, resource_name)
+    row_index, col_index = _get_foreign_key_positions(dirpath, resource)
+
+    if cache or resource["format"] != "csv":
+        arrays = _get_numeric_arrays(
+            dirpath, resource, row_index, col_index, cache, workers
+        )
+        yield from iterate_array_chunks(arrays, chunksize)
+    else:
+        yield from iterate_compressed_csv_as_arrays(
+            dirpath / resource["path"],
+            row_index,
+            col_index,
+            workers,
+            get_resource_compression(resource),
+            chunksize,
+        )
+
+
+def get_numeric_data_iterator(
+    dirpath, resource_name, cache=False, workers=1, codes=False
+):
+    """Iterate over ``(row metadata, column metadata, value)`` for a numeric resource.
+
+    If ``codes`` is ``True``, yield ``(row code, column code, value)``
+    instead, where the codes are integer positions in the foreign key
+    resources, e.g. in ``get_metadata_records``. This avoids a reference to
+    a metadata dictionary for every value.
+
+    If ``cache`` is ``True``, the parsed indices and values are stored as
+    ``.npy`` sidecar files next to ``datapackage.json`` on the first read,
+    and memory-mapped on later reads as long as the resource hash (or, for
+    resources without a hash, the file modification time and size) matches.
+    Parquet and matrix (``.npy`` and ``.npz``) resources are always read in
+    bulk, and are not cached.
+
+    With more than one worker, multi-stream bz2 files are decompressed and
+    parsed in parallel processes. Values are read in chunks with
+    ``get_numeric_data_chunks``.
+
+    Like all readers, ``dirpath`` can also be a tar archive written by
+    ``package_exiobase``, which is read in place. Archives can't be cached,
+    and ``get_row`` and ``get_column`` need an extracted directory."""
+    chunks = get_numeric_data_chunks(dirpath, resource_name, cache, workers)
+    if codes:
+        for rows, cols, values in chunks:
+            yield from zip(rows.tolist(), cols.tolist(), values.tolist())
+        return
 
-    assert len(resource["foreignKeys"]) == 2
+    dirpath = _get_valid_dirpath(dirpath)
+    _, row_data, _, col_data = _get_foreign_key_data(
+        dirpath, _get_resource(dirpath, resource_name)
+    )
+    for rows, cols, values in chunks:
+        yield from zip(
+            map(row_data.__getitem__, rows.tolist()),
+            map(col_data.__getitem__, cols.tolist()),
+            values.tolist(),
+        )
 
-    row_id_field, row_resource = _get_foreign_key(
-        dirpath, resource, resource["schema"]["fields"][0]["name"]
+
+def get_sparse_matrix(dirpath, resource_name, format="csr", cache=False, workers=1):
+    """Load a numeric resource as a ``scipy.sparse`` matrix.
+
+    Returns ``(matrix, row_labels, col_labels)``. The labels are arrays of ids,
+    in the order of the foreign key resources, and give the meaning of each
+    matrix row and column. ``format`` is any ``scipy.sparse`` format name,
+    e.g. ``csr``, ``csc`` or ``coo``.
+
+    Resources stored as ``.npz`` (e.g. ``hiot.npz``) are read directly; CSV
+    resources are parsed into arrays without building per-element Python
+    objects. ``cache`` and ``workers`` are used as in ``get_numeric_data_iterator``."""
+    import numpy as np
+    import scipy.sparse
+
+    dirpath = _get_valid_dirpath(dirpath)
+    resource = _get_resource(dirpath, resource_name)
+    # The cached ``{id: position}`` dictionaries are in metadata order
+    row_index, col_index = _get_foreign_key_positions(dirpath, resource)
+    row_labels = np.array(list(row_index))
+    col_labels = np.array(list(col_index))
+    shape = (len(row_labels), len(col_labels))
+
+    if resource["path"].endswith(".npz"):
+        matrix = load_sparse_matrix(dirpath / resource["path"])
+        assert matrix.shape == shape
+    else:
+        rows, cols, values = _get_numeric_arrays(
+            dirpath, resource, row_index, col_index, cache, workers
+        )
+        matrix = scipy.sparse.coo_matrix((values, (rows, cols)), shape=shape)
+
+    return matrix.asformat(format), row_labels, col_labels
+
+
+# Tables of a supply-use datapackage, and the resource of their columns
+SUPPLY_USE_TABLES = {
+    "supply": "activities",
+    "use": "activities",
+    "final-demand": "final-demand-categories",
+    "stock-to-waste": "final-demand-categories",
+}
+
+
+def get_supply_use_tables(dirpath, format="csr", cache=False, workers=1):
+    """Load the supply, use, final demand and stock to waste tables of SU data.
+
+    Returns ``(tables, product_labels, activity_labels, category_labels)``.
+    ``tables`` maps the resource names in ``SUPPLY_USE_TABLES`` to
+    ``scipy.sparse`` matrices in ``format``, which all have one row for each
+    of the ``product_labels``, in the same order. The columns of supply and
+    use are the ``activity_labels``, and those of final demand and stock to
+    waste the final demand ``category_labels``. Tables written as ``.npz``
+    files by the hybrid SU converter are read directly; other options are
+    as in ``get_sparse_matrix``."""
+    import numpy as np
+
+    tables, labels = {}, {}
+    for name, columns in SUPPLY_USE_TABLES.items():
+        tables[name], row_labels, col_labels = get_sparse_matrix(
+            dirpath, name, format, cache, workers
+        )
+        for key, value in (("products", row_labels), (columns, col_labels)):
+            if key in labels:
+                assert np.array_equal(labels[key], value)
+            labels[key] = value
+    return (
+        tables,
+        labels["products"],
+        labels["activities"],
+        labels["final-demand-categories"],
     )
-    row_mapping = {
-        elem[row_id_field]: elem
-        for elem in get_metadata_resource(dirpath, row_resource["name"])
-    }
 
-    col_id_field, col_resource = _get_foreign_key(
-        dirpath, resource, resource["schema"]["fields"][1]["name"]
+
+def get_dense_matrix(dirpath, resource_name, mmap_mode="r", cache=False, workers=1):
+    """Load a numeric resource as a dense float64 NumPy array.
+
+    Returns ``(matrix, row_labels, col_labels)`` like ``get_sparse_matrix``.
+    Resources stored as ``.npy`` (e.g. ``hiot.npy``) and their id sidecars
+    are memory-mapped with ``mmap_mode``, without parsing any metadata, so
+    several processes can share one copy in the page cache; use
+    ``mmap_mode=None`` to read them into memory instead. Other resources are
+    built from ``get_sparse_matrix``."""
+    dirpath = _get_valid_dirpath(dirpath)
+    resource = _get_resource(dirpath, resource_name)
+    if resource["format"] == "npy":
+        matrix, row_labels, col_labels = load_dense_matrix(
+            dirpath / resource["path"], mmap_mode
+        )
+        assert matrix.shape == (len(row_labels), len(col_labels))
+        return matrix, row_labels, col_labels
+
+    matrix, row_labels, col_labels = get_sparse_matrix(
+        dirpath, resource_name, "coo", cache, workers
+    )
+    return matrix.toarray(), row_labels, col_labels
+
+
+def get_leontief_model(
+    dirpath, solver="lu", tol=1e-10, maxiter=1000, cache=False, workers=1
+):
+    """Build a ``LeontiefModel`` from the tables of a hybrid IO datapackage.
+
+    ``A`` is built from the ``hiot`` and ``production-exchanges`` resources,
+    and ``B`` from ``extension-exchanges``; footprints are keyed by the ids
+    of the ``extensions`` resource. Keep the model to reuse the
+    factorisation of ``I - A`` for many final demands, e.g.::
+
+        model = get_leontief_model(dirpath)
+        model.get_footprints([{product id: 1}, ...])
+
+    ``solver``, ``tol`` and ``maxiter`` are passed to ``LeontiefModel``, and
+    ``cache`` and ``workers`` are used as in ``get_numeric_data_iterator``."""
+    import numpy as np
+
+    technosphere, products, activities = get_sparse_matrix(
+        dirpath, "hiot", "csc", cache, workers
+    )
+    production, row_labels, col_labels = get_sparse_matrix(
+        dirpath, "production-exchanges", "coo", cache, workers
+    )
+    assert np.array_equal(row_labels, products)
+    assert np.array_equal(col_labels, activities)
+    extensions, extension_labels, col_labels = get_sparse_matrix(
+        dirpath, "extension-exchanges", "csr", cache, workers
+    )
+    assert np.array_equal(col_labels, activities)
+    return LeontiefModel(
+        technosphere,
+        production,
+        extensions,
+        products,
+        activities,
+        extension_labels,
+        solver,
+        tol,
+        maxiter,
+    )
+
+
+def _get_indexed_arrays(dirpath, resource, row_index, col_index, workers=1):
+    """Get cached arrays and their offset index, building both on first use"""
+    arrays = load_cached_arrays(dirpath, resource)
+    if arrays is None and resource["format"] != "csv":
+        arrays = save_cached_arrays(
+            dirpath,
+            resource,
+            _get_numeric_arrays(dirpath, resource, row_index, col_index),
+        )
+    elif arrays is None:
+        arrays = write_cached_arrays(dirpath, resource, row_index, col_index, workers)
+
+    index = load_cached_index(dirpath, resource)
+    if index is None:
+        shape = (len(row_index), len(col_index))
+        index = write_cached_index(dirpath, resource, arrays, shape)
+    return arrays, index
+
+
+def _get_indexed_values(dirpath, resource_name, id, axis, workers=1):
+    """Get ``(metadata, value)`` for the values in one row (``axis=0``) or column"""
+    dirpath = _get_valid_dirpath(dirpath)
+    resource = _get_resource(dirpath, resource_name)
+    assert len(resource["foreignKeys"]) == 2
+
+    id_fields, references, positions = [], [], []
+    for field in resource["schema"]["fields"][:2]:
+        id_field, reference = _get_foreign_key(dirpath, resource, field["name"])
+        id_fields.append(id_field)
+        references.append(reference)
+        positions.append(load_metadata_positions(dirpath, reference, id_field))
+
+    (rows, cols, values), index = _get_indexed_arrays(
+        dirpath, resource, positions[0], positions[1], workers
     )
-    col_mapping = {
-        elem[col_id_field]: elem
-        for elem in get_metadata_resource(dirpath, col_resource["name"])
-    }
+    order, indptr = index[2 * axis], index[2 * axis + 1]
+    position = positions[axis][id]
+    selected = order[indptr[position] : indptr[position + 1]]
+
+    # Only the metadata records of the selected values are built
+    other = references[1 - axis]
+    names = [f["name"] for f in other["schema"]["fields"]]
+    records = load_metadata_rows(dirpath, other)
+    return [
+        (dict(zip(names, records[elem])), value)
+        for elem, value in zip(
+            (cols if axis == 0 else rows)[selected].tolist(),
+            values[selected].tolist(),
+        )
+    ]
+
 
-    for row, col, value in iterate_compressed_csv(Path(dirpath) / resource["path"]):
-        yield row_mapping[row], col_mapping[col], float(value)
+def get_row(dirpath, resource_name, id, workers=1):
+    """Get ``(column metadata, value)`` for the values in the row with ``id``.
 
+    For example, ``get_row(dirpath, "extension-exchanges", id)`` returns the
+    activities which emit an extension. An offset index from row and column
+    positions to values is stored as ``.npy`` sidecar files on first use,
+    together with the cache of ``get_numeric_data_iterator``, and rebuilt if
+    the resource changes. Raises ``KeyError`` for unknown ids."""
+    return _get_indexed_values(dirpath, resource_name, id, 0, workers)
+
+
+def get_column(dirpath, resource_name, id, workers=1):
+    """Get ``(row metadata, value)`` for the values in the column with ``id``.
+
+    For example, ``get_column(dirpath, "hiot", id)`` returns the inputs of an
+    activity. Uses the same offset index as ``get_row``."""
+    return _get_indexed_values(dirpath, resource_name, id, 1, workers)
+
+
+def get_table(dirpath, resource_name, columns=None, filters=None):
+    """Load a Parquet resource as a ``pyarrow.Table``.
+
+    ``columns`` and ``filters`` are pushed down to the Parquet reader, e.g.
+    ``filters=[("location", "=", "DE")]``. Id columns are dictionary-encoded,
+    and become categoricals with ``table.to_pandas()``; use
+    ``polars.from_arrow(table)`` for polars."""
+    dirpath = _get_valid_dirpath(dirpath)
+    resource = _get_resource(dirpath, resource_name)
+    assert resource["format"] == "parquet"
+    return load_parquet(dirpath / resource["path"], columns=columns, filters=filters)
 
 # DATA_DIR = Path(__file__, "..").resolve() / "data"
 # DATA_DIR.mkdir(mode=0o777, exist_ok=True)
@@ -160,3 +538,4 @@ def get_numeric_data_iterator(dirpath, resource_name):
 #                 if i >= row_offset and j >= col_offset and value:
 #                     if float(value) == 0:
 #                     yield (i - row_offset, j - col_offset, float(value))
+
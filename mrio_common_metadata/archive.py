@@ -0,0 +1,185 @@
+"""Read datapackages in place from the uncompressed tar archives of ``package_exiobase``.
+
+An archive is indexed once, and the index of member data offsets is kept
+in memory while the archive is unchanged. Members are then read directly
+at their offset in the archive, without extracting them."""
+from functools import lru_cache
+from pathlib import Path
+import io
+
+
+@lru_cache(maxsize=16)
+def _load_index(filepath, mtime_ns, size):
+    import tarfile
+
+    try:
+        tar = tarfile.open(filepath, "r:")
+    except tarfile.ReadError:
+        raise ValueError(
+            "{} is not an uncompressed tar archive; compressed archives must "
+            "be extracted first".format(filepath)
+        )
+    # Only the member headers are read; the data is skipped with ``seek``
+    with tar:
+        return {
+            info.name: (info.offset_data, info.size)
+            for info in tar
+            if info.isfile() and not info.issparse()
+        }
+
+
+def load_index(filepath):
+    """Get ``{member name: (data offset, size)}`` for the files in a tar archive"""
+    stat = filepath.stat()
+    return _load_index(filepath.absolute(), stat.st_mtime_ns, stat.st_size)
+
+
+class MemberFile(io.RawIOBase):
+    """Raw binary file for one member of a tar archive.
+
+    Reads and seeks are limited to the bytes of the member."""
+
+    def __init__(self, filepath, offset, size):
+        self._file = open(filepath, "rb")
+        self._offset = offset
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, position, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            position += self._position
+        elif whence == io.SEEK_END:
+            position += self._size
+        if position < 0:
+            raise ValueError("Negative seek position {}".format(position))
+        self._position = position
+        return position
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._size - self._position)
+        if size <= 0:
+            return 0
+        self._file.seek(self._offset + self._position)
+        count = self._file.readinto(memoryview(buffer)[:size])
+        self._position += count
+        return count
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+class TarMember:
+    """A file in a tar archive, with the parts of the ``Path`` interface used by readers"""
+
+    def __init__(self, parent, name):
+        self.parent = parent
+        self.name = name
+
+    @property
+    def archive(self):
+        return self.parent.archive
+
+    @property
+    def offset(self):
+        return load_index(self.archive)[self.name][0]
+
+    @property
+    def size(self):
+        return load_index(self.archive)[self.name][1]
+
+    def __str__(self):
+        return "{}/{}".format(self.archive, self.name)
+
+    def __repr__(self):
+        return "TarMember({!r}, {!r})".format(str(self.archive), self.name)
+
+    def __eq__(self, other):
+        return isinstance(other, TarMember) and (self.archive, self.name) == (
+            other.archive,
+            other.name,
+        )
+
+    def __hash__(self):
+        return hash((self.archive, self.name))
+
+    def absolute(self):
+        return TarMember(TarPackage(self.archive.absolute()), self.name)
+
+    def is_file(self):
+        return self.name in load_index(self.archive)
+
+    def stat(self):
+        """Status of the archive, which changes whenever any member is rewritten"""
+        return self.archive.stat()
+
+    def open(self, mode="r", buffering=-1, encoding=None, errors=None, newline=None):
+        """Open the member for reading, like ``Path.open``"""
+        if mode not in ("r", "rt", "rb"):
+            raise ValueError("Archive members can only be opened for reading")
+        try:
+            offset, size = load_index(self.archive)[self.name]
+        except KeyError:
+            raise FileNotFoundError(
+                "No member {} in {}".format(self.name, self.archive)
+            )
+        raw = MemberFile(self.archive, offset, size)
+        if buffering == 0:
+            return raw
+        buffered = io.BufferedReader(
+            raw, buffering if buffering > 0 else io.DEFAULT_BUFFER_SIZE
+        )
+        if mode == "rb":
+            return buffered
+        return io.TextIOWrapper(buffered, encoding, errors, newline)
+
+
+class TarPackage:
+    """The directory of a datapackage, read from a tar archive.
+
+    ``package / name`` gives a ``TarMember``, like ``Path`` does for files."""
+
+    def __init__(self, archive):
+        self.archive = Path(archive)
+
+    def __truediv__(self, name):
+        return TarMember(self, name)
+
+    def __str__(self):
+        return str(self.archive)
+
+    def __repr__(self):
+        return "TarPackage({!r})".format(str(self.archive))
+
+    def __eq__(self, other):
+        return isinstance(other, TarPackage) and self.archive == other.archive
+
+    def __hash__(self):
+        return hash(self.archive)
+
+
+def open_binary(filepath):
+    """Open a file, or a ``TarMember``, for reading bytes"""
+    if isinstance(filepath, TarMember):
+        return filepath.open("rb")
+    return open(filepath, "rb")
+
+
+def get_byte_range(filepath):
+    """Get ``(filepath, offset, size)`` of the bytes of a file or ``TarMember``.
+
+    The returned ``filepath`` is the archive for members, and can be opened
+    or memory-mapped directly."""
+    if isinstance(filepath, TarMember):
+        return (filepath.archive, filepath.offset, filepath.size)
+    return (filepath, 0, Path(filepath).stat().st_size)
@@ -0,0 +1,265 @@
+from .archive import TarPackage, _load_index
+from .utils import (
+    get_resource_compression,
+    load_compressed_csv,
+    load_compressed_csv_as_arrays,
+    load_parquet_as_rows,
+)
+from collections import namedtuple
+from functools import lru_cache
+import json
+import os
+import re
+
+
+ARRAYS = ("rows", "cols", "values")
+INDEX = ("row_order", "row_indptr", "col_order", "col_indptr")
+
+
+def _file_key(filepath):
+    """Key for in-memory caches which changes whenever the file is rewritten"""
+    stat = filepath.stat()
+    return (filepath.absolute(), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=16)
+def _load_descriptor(filepath, mtime_ns, size):
+    with filepath.open() as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=64)
+def _load_metadata_rows(filepath, mtime_ns, size, hash, compression):
+    # ``compression`` is ``None`` for Parquet files
+    if compression is None:
+        data = load_parquet_as_rows(filepath)
+    else:
+        data = load_compressed_csv(filepath, compression=compression)
+    return tuple(tuple(row) for row in data)
+
+
+def load_descriptor(dirpath):
+    """Load ``datapackage.json``, reusing the parsed result while the file is unchanged.
+
+    The returned object is shared between calls, and should not be modified."""
+    return _load_descriptor(*_file_key(dirpath / "datapackage.json"))
+
+
+def _metadata_key(dirpath, resource):
+    if resource["format"] == "parquet":
+        compression = None
+    else:
+        compression = get_resource_compression(resource)
+    return (*_file_key(dirpath / resource["path"]), resource.get("hash"), compression)
+
+
+def load_metadata_rows(dirpath, resource):
+    """Load the rows of a metadata resource as tuples of strings.
+
+    Decoded rows are kept in memory, and reloaded if the file modification
+    time, size, or resource hash changes."""
+    return _load_metadata_rows(*_metadata_key(dirpath, resource))
+
+
+@lru_cache(maxsize=64)
+def _load_metadata_positions(filepath, mtime_ns, size, hash, compression, column):
+    rows = _load_metadata_rows(filepath, mtime_ns, size, hash, compression)
+    return {row[column]: position for position, row in enumerate(rows)}
+
+
+def load_metadata_positions(dirpath, resource, field):
+    """Get ``{id: position}`` for the ids in column ``field`` of a metadata resource.
+
+    Cached in memory like ``load_metadata_rows``."""
+    column = [f["name"] for f in resource["schema"]["fields"]].index(field)
+    return _load_metadata_positions(*_metadata_key(dirpath, resource), column)
+
+
+@lru_cache(maxsize=64)
+def _load_metadata_records(
+    filepath, mtime_ns, size, hash, compression, typename, field_names
+):
+    record = namedtuple(typename, field_names)
+    rows = _load_metadata_rows(filepath, mtime_ns, size, hash, compression)
+    return tuple(record._make(row) for row in rows)
+
+
+def _identifier(name):
+    """Turn e.g. ``code 1`` into ``code_1``"""
+    name = re.sub(r"\W", "_", name)
+    return "_" + name if name[0].isdigit() else name
+
+
+def load_metadata_records(dirpath, resource):
+    """Load the rows of a metadata resource as named tuples.
+
+    Field names are turned into identifiers, e.g. ``record.code_1``. Cached
+    in memory like ``load_metadata_rows``."""
+    return _load_metadata_records(
+        *_metadata_key(dirpath, resource),
+        "".join(part.title() for part in re.split(r"\W", resource["name"])),
+        tuple(_identifier(field["name"]) for field in resource["schema"]["fields"]),
+    )
+
+
+def clear_cache():
+    """Empty the in-memory caches of descriptors, metadata, tar indices and sidecar files"""
+    _load_descriptor.cache_clear()
+    _load_metadata_rows.cache_clear()
+    _load_metadata_positions.cache_clear()
+    _load_metadata_records.cache_clear()
+    _open_sidecars.cache_clear()
+    _load_index.cache_clear()
+
+
+def _sidecar_filepaths(dirpath, resource, labels=ARRAYS, kind="cache"):
+    """Return filepaths of the sidecar files for ``resource``.
+
+    The sidecar files are stored next to ``datapackage.json``, one ``.npy``
+    file per array plus a small JSON file recording the source hash. Tar
+    archives are read-only, and have no sidecar files."""
+    if isinstance(dirpath, TarPackage):
+        raise ValueError(
+            "Sidecar files need an extracted datapackage, not {}".format(dirpath)
+        )
+    filepaths = {
+        label: dirpath / "{}.{}.npy".format(resource["name"], label)
+        for label in labels
+    }
+    filepaths["metadata"] = dirpath / "{}.{}.json".format(resource["name"], kind)
+    return filepaths
+
+
+def _resource_hash(dirpath, resource):
+    """Use the hash recorded by ``package_exiobase`` if present.
+
+    Otherwise, the file modification time and size are used, so lookups don't
+    read the whole resource file."""
+    if resource.get("hash"):
+        return resource["hash"]
+    stat = (dirpath / resource["path"]).stat()
+    return "stat:{}:{}".format(stat.st_mtime_ns, stat.st_size)
+
+
+def _replace_file(filepath, write):
+    """Write ``filepath`` with ``write(file object)`` through a temporary file.
+
+    The file is replaced in one step, so readers, including existing memory
+    maps, see either the old or the new file, never a partial one."""
+    temporary = filepath.with_name("{}.{}.tmp".format(filepath.name, os.getpid()))
+    try:
+        with open(temporary, "wb") as f:
+            write(f)
+        os.replace(temporary, filepath)
+    finally:
+        if temporary.exists():
+            temporary.unlink()
+
+
+@lru_cache(maxsize=32)
+def _open_sidecars(filepaths, metadata_filepath, mtime_ns, size):
+    import numpy as np
+
+    return tuple(np.load(filepath, mmap_mode="r") for filepath in filepaths)
+
+
+def _load_sidecars(dirpath, resource, labels, kind):
+    filepaths = _sidecar_filepaths(dirpath, resource, labels, kind)
+    try:
+        with open(filepaths["metadata"]) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if metadata.get("hash") != _resource_hash(dirpath, resource):
+        return None
+    if not all(filepaths[label].is_file() for label in labels):
+        return None
+    # The metadata file is written last, so its key changes whenever the arrays do
+    return _open_sidecars(
+        tuple(str(filepaths[label]) for label in labels),
+        *_file_key(filepaths["metadata"]),
+    )
+
+
+def _save_sidecars(dirpath, resource, labels, kind, arrays):
+    import numpy as np
+
+    filepaths = _sidecar_filepaths(dirpath, resource, labels, kind)
+    metadata = json.dumps({"hash": _resource_hash(dirpath, resource)}).encode()
+
+    # The old metadata is removed first, and the new one is written last, so
+    # that an interrupted write is not seen as a valid cache
+    filepaths["metadata"].unlink(missing_ok=True)
+    for label, arr in zip(labels, arrays):
+        _replace_file(filepaths[label], lambda f: np.save(f, arr))
+    _replace_file(filepaths["metadata"], lambda f: f.write(metadata))
+
+    return _load_sidecars(dirpath, resource, labels, kind)
+
+
+def load_cached_arrays(dirpath, resource):
+    """Load memory-mapped row indices, column indices and values.
+
+    Returns ``None`` if there is no cache, or if the cache was built from a
+    different version of the resource file."""
+    return _load_sidecars(dirpath, resource, ARRAYS, "cache")
+
+
+def save_cached_arrays(dirpath, resource, arrays):
+    """Store ``(rows, cols, values)`` arrays as sidecar files, and load them back"""
+    return _save_sidecars(dirpath, resource, ARRAYS, "cache", arrays)
+
+
+def write_cached_arrays(dirpath, resource, row_index, col_index, workers=1):
+    """Parse the CSV resource once, and store it as binary arrays.
+
+    ``row_index`` and ``col_index`` map row and column ids to their integer
+    position in the respective foreign key resource."""
+    arrays = load_compressed_csv_as_arrays(
+        dirpath / resource["path"],
+        row_index,
+        col_index,
+        workers,
+        get_resource_compression(resource),
+    )
+    return save_cached_arrays(dirpath, resource, arrays)
+
+
+def load_cached_index(dirpath, resource):
+    """Load the memory-mapped offset index of a resource.
+
+    The index is ``(row_order, row_indptr, col_order, col_indptr)``. The
+    positions in the cached arrays of the values in row ``i`` are
+    ``row_order[row_indptr[i]:row_indptr[i + 1]]``, and likewise for columns.
+    Returns ``None`` if there is no index for this version of the resource."""
+    return _load_sidecars(dirpath, resource, INDEX, "index")
+
+
+def write_cached_index(dirpath, resource, arrays, shape):
+    """Build the offset index for cached ``(rows, cols, values)`` arrays, and store it.
+
+    ``shape`` is the number of rows and columns in the foreign key resources."""
+    import numpy as np
+
+    index = []
+    for positions, length in zip(arrays[:2], shape):
+        # A stable sort keeps the values of each row or column in file order
+        order = np.argsort(positions, kind="stable")
+        indptr = np.zeros(length + 1, dtype=np.int64)
+        np.cumsum(np.bincount(positions, minlength=length), out=indptr[1:])
+        index.extend((order, indptr))
+    return _save_sidecars(dirpath, resource, INDEX, "index", index)
+
+
+def iterate_array_chunks(arrays, chunksize=2 ** 16):
+    """Iterate over ``(rows, cols, values)`` in chunks of at most ``chunksize`` values"""
+    rows, cols, values = arrays
+    for start in range(0, len(values), chunksize):
+        end = start + chunksize
+        yield rows[start:end], cols[start:end], values[start:end]
+
+
+def iterate_cached_arrays(arrays, chunksize=2 ** 16):
+    """Iterate over ``(row index, col index, value)`` as Python types"""
+    for rows, cols, values in iterate_array_chunks(arrays, chunksize):
+        yield from zip(rows.tolist(), cols.tolist(), values.tolist())
@@ -0,0 +1,186 @@
+"""Leontief inverse and footprint calculations for input-output tables.
+
+The technical coefficients are ``A = Z diag(x)^-1``, where ``Z`` holds the
+inputs of products to activities, and ``x`` the production of each activity.
+For a final demand ``y`` of products, the activity outputs ``s`` solve
+``(I - A) s = y``, and the footprint is ``B s``, with the extension
+intensities ``B = F diag(x)^-1``.
+
+With the ``lu`` solver, ``I - A`` is factorised once, with a sparse LU
+decomposition, and each batch of final demand vectors is then solved against
+the same factors. The ``iterative`` solver sums the series ``y + A y + A^2 y
++ ...`` for a whole batch at once instead; it needs no factorisation, which
+can fill in badly for large tables, but only converges if the spectral
+radius of ``A`` is below one."""
+
+SOLVERS = ("lu", "iterative")
+
+
+def get_inverse_production(production):
+    """Get ``diag(x)^-1`` from a square, diagonal production matrix.
+
+    Activities without production get zero, i.e. have no coefficients."""
+    import numpy as np
+    import scipy.sparse
+
+    production = scipy.sparse.coo_matrix(production)
+    assert production.shape[0] == production.shape[1]
+    assert (production.row == production.col).all(), "Production is not diagonal"
+    output = production.diagonal()
+    inverse = np.zeros_like(output)
+    np.divide(1, output, out=inverse, where=output != 0)
+    return scipy.sparse.diags(inverse, format="csc")
+
+
+class LeontiefModel:
+    """Solve ``(I - A) s = y`` for many final demands, and calculate footprints.
+
+    ``technosphere`` is the ``Z`` matrix of inputs, and ``production`` the
+    diagonal matrix of ``x``, both with one row per product and one column
+    per activity. ``extensions`` is the ``F`` matrix, with one row per
+    extension and one column per activity. The labels give the ids of the
+    rows and columns, in order; final demands can be given as
+    ``{product id: amount}`` dictionaries.
+
+    ``solver`` is one of ``SOLVERS``. With ``lu``, ``I - A`` is factorised
+    on the first solve, and the factors are kept for the lifetime of the
+    model. With ``iterative``, series terms are added until they are below
+    ``tol`` times the solution, for at most ``maxiter`` terms."""
+
+    def __init__(
+        self,
+        technosphere,
+        production,
+        extensions,
+        product_labels,
+        activity_labels,
+        extension_labels,
+        solver="lu",
+        tol=1e-10,
+        maxiter=1000,
+    ):
+        import scipy.sparse
+
+        if solver not in SOLVERS:
+            raise ValueError(
+                "Unknown solver {}; use one of {}".format(solver, SOLVERS)
+            )
+
+        assert technosphere.shape == (len(product_labels), len(activity_labels))
+        assert production.shape == technosphere.shape
+        assert extensions.shape == (len(extension_labels), len(activity_labels))
+
+        inverse = get_inverse_production(production)
+        self.A = scipy.sparse.csc_matrix(technosphere) @ inverse
+        self.B = scipy.sparse.csr_matrix(extensions) @ inverse
+        self.product_labels = product_labels
+        self.activity_labels = activity_labels
+        self.extension_labels = extension_labels
+        self.solver = solver
+        self.tol = tol
+        self.maxiter = maxiter
+        self._product_index = {
+            label: index for index, label in enumerate(product_labels.tolist())
+        }
+        self._lu = None
+
+    @property
+    def lu(self):
+        """The ``scipy.sparse.linalg.splu`` factorisation of ``I - A``"""
+        if self._lu is None:
+            import scipy.sparse
+            import scipy.sparse.linalg
+
+            matrix = scipy.sparse.identity(self.A.shape[0], format="csc") - self.A
+            self._lu = scipy.sparse.linalg.splu(matrix.tocsc())
+        return self._lu
+
+    def _solve_iteratively(self, demand):
+        import numpy as np
+
+        solution = demand.copy()
+        term = demand
+        for _ in range(self.maxiter):
+            term = self.A @ term
+            solution += term
+            if (np.abs(term).max(0) <= self.tol * np.abs(solution).max(0)).all():
+                return solution
+        raise ValueError(
+            "No convergence after {} terms; use the lu solver".format(self.maxiter)
+        )
+
+    def _solve_batch(self, demand):
+        """Solve for a dense demand vector, or matrix with one column per demand"""
+        import numpy as np
+
+        if self.solver == "iterative":
+            return self._solve_iteratively(np.asarray(demand, dtype=np.float64))
+        return self.lu.solve(np.asfortranarray(demand, dtype=np.float64))
+
+    def get_demand_matrix(self, demands):
+        """Build a sparse matrix with one column per ``{product id: amount}`` demand"""
+        import scipy.sparse
+
+        rows, cols, values = [], [], []
+        for col, demand in enumerate(demands):
+            for product, amount in demand.items():
+                rows.append(self._product_index[product])
+                cols.append(col)
+                values.append(amount)
+        return scipy.sparse.csc_matrix(
+            (values, (rows, cols)), shape=(len(self.product_labels), len(demands))
+        )
+
+    def _iterate_solutions(self, demand, batchsize):
+        """Solve for ``batchsize`` columns of a (sparse) demand matrix at a time"""
+        import scipy.sparse
+
+        if scipy.sparse.issparse(demand):
+            demand = demand.tocsc()
+        for start in range(0, demand.shape[1], batchsize):
+            batch = demand[:, start : start + batchsize]
+            if scipy.sparse.issparse(batch):
+                batch = batch.toarray()
+            yield self._solve_batch(batch)
+
+    def solve(self, demand, batchsize=256):
+        """Get the activity outputs ``s`` for a final demand vector or matrix.
+
+        ``demand`` is a NumPy array or ``scipy.sparse`` matrix with one row
+        per product, and one column per final demand. The columns are solved
+        ``batchsize`` at a time, and a dense array of the same shape is
+        returned."""
+        import numpy as np
+
+        if demand.ndim == 1:
+            return self._solve_batch(demand)
+        return np.hstack(
+            list(self._iterate_solutions(demand, batchsize))
+            or [np.zeros((demand.shape[0], 0))]
+        )
+
+    def calculate(self, demand, batchsize=256):
+        """Get the footprints ``B s`` for a final demand vector or matrix.
+
+        Like ``solve``, but returns one row per extension. Only one batch of
+        activity outputs is kept in memory at a time."""
+        import numpy as np
+
+        if demand.ndim == 1:
+            return self.B @ self.solve(demand)
+        solutions = self._iterate_solutions(demand, batchsize)
+        return np.hstack(
+            [self.B @ solution for solution in solutions]
+            or [np.zeros((self.B.shape[0], 0))]
+        )
+
+    def get_footprints(self, demands, batchsize=256):
+        """Get ``{extension id: amount}`` for each ``{product id: amount}`` demand.
+
+        ``demands`` is a list of dictionaries, which are solved together in
+        batches; a single dictionary gives a single result."""
+        if isinstance(demands, dict):
+            return self.get_footprints([demands], batchsize)[0]
+        footprints = self.calculate(self.get_demand_matrix(demands), batchsize)
+        labels = self.extension_labels.tolist()
+        return [dict(zip(labels, column)) for column in footprints.T.tolist()]
@@ -1,272 +1,488 @@
-import pandas
 
 from .datapackage import DATAPACKAGE
-from .utils import (
+from .utils import read_principal_production_csv
+from .version_config import VERSIONS
+from ..instrumentation import get_recorder, logger
+from ..pipeline import (
+    get_datafile,
+    load_metadata,
+    run_conversion,
+    select_resources,
+    write_archive,
+)
+from ..utils import (
     write_compressed_csv,
-    extract_with_pandas,
-    read_xlsb,
-    get_numeric_data_iterator,
     get_headers,
-    md5,
+    get_sparse_numeric_data_iterator,
+    iterate_xlsb,
+    split_headers,
+    WorkbookSession,
 )
-from .version_config import VERSIONS
-from pathlib import Path
-import bz2
-import csv
-import json
-import pyxlsb
-import tarfile
-import scipy.sparse
-
-
-def convert_exiobase(sourcedir, targetdir=None, version="3.3.17 hybrid"):
-
-    # sanitize user input: sourcedir must be path
-    if not isinstance(sourcedir, Path):
-        sourcedir = Path(sourcedir)
-
-    # default target directory = source directory/datapackage
-    if targetdir is None:
-        targetdir = sourcedir / "datapackage"
-        targetdir.mkdir(exist_ok=True)
-
-    # extract data
-    extract_metadata(sourcedir, targetdir, version)
-    extract_extension_exchanges(sourcedir, targetdir, version)
-    extract_production_exchanges(sourcedir, targetdir, version)
-    extract_io_exchanges(sourcedir, targetdir, version)
-
-    # turn files into one datapackage
-    package_exiobase(targetdir, version)
-
-    # print and return path of datapackage
-    print(f"Conversion successful: {targetdir}")
-    return targetdir
-
+from ...utils import (
+    open_dense_matrix,
+    write_dense_matrix_labels,
+    write_parquet,
+    write_parquet_matrix,
+)
+import copy
+import itertools
+
+
+def convert_exiobase(
+    sourcedir,
+    targetdir=None,
+    version="3.3.17 hybrid",
+    workers=1,
+    compression="bz2",
+    compresslevel=None,
+    output_format="csv",
+    resume=True,
+    hash="md5",
+    callback=None,
+    profile=None,
+    profiler="cprofile",
+    dense=False,
+):
+    """Convert EXIOBASE hybrid IO source files to a datapackage in ``targetdir``.
+
+    ``workers`` is the number of processes to use. With more than one worker,
+    the extension, production and technosphere exchanges are extracted
+    concurrently once the metadata is available, and the remaining workers
+    are shared out to compress output files.
+    ``compression`` is the codec for CSV files (``bz2``, ``gzip``, ``lz4``
+    or ``zstd``), and ``compresslevel`` its compression level.
+    ``output_format`` is ``csv`` or ``parquet``; Parquet output needs
+    ``pyarrow``, and ignores the compression options. If ``dense`` is
+    ``True``, the technosphere matrix is written as a dense ``hiot.npy``
+    matrix (see ``extract_io_exchanges``).
+
+    Completed stages are recorded in a manifest in ``targetdir``. If
+    ``resume`` is ``True``, stages whose source files, parameters and output
+    files are unchanged since they last completed are skipped.
+
+    ``hash`` is the algorithm used to hash resource files when packaging
+    them (see ``package_exiobase``).
+
+    The wall time, rows and cells read, bytes written, peak memory and time
+    per phase of each stage (see ``instrumentation``) are logged, and passed
+    as a dictionary to ``callback(metrics)`` if given. If ``profile`` is a
+    directory, each stage is profiled with ``profiler`` (``cprofile`` or
+    ``pyinstrument``), and the results are written there."""
+    return run_conversion(
+        sourcedir,
+        targetdir,
+        version,
+        extract_metadata,
+        [
+            extract_extension_exchanges,
+            extract_production_exchanges,
+            extract_io_exchanges,
+        ],
+        package_exiobase,
+        STAGE_OUTPUTS,
+        get_stage_sources,
+        workers=workers,
+        compression=compression,
+        compresslevel=compresslevel,
+        output_format=output_format,
+        resume=resume,
+        hash=hash,
+        callback=callback,
+        profile=profile,
+        profiler=profiler,
+        stage_options={"extract_io_exchanges": {"dense": dense}},
+    )
 
 
-def package_exiobase(targetdir, version, datafile=None, metafile=None, flush=True):
+# Resources written by each conversion stage
+STAGE_OUTPUTS = {
+    "extract_metadata": ["extensions", "locations", "products", "activities"],
+    "extract_extension_exchanges": ["extension-exchanges"],
+    "extract_production_exchanges": ["production-exchanges"],
+    "extract_io_exchanges": ["hiot"],
+}
+
+
+def get_stage_sources(version, stage):
+    """Get the source filenames read by conversion ``stage``"""
+    config = VERSIONS[version]
+    if stage == "extract_metadata":
+        objs = itertools.chain(*config["nomenclature"].values())
+    elif stage == "extract_extension_exchanges":
+        objs = config["biosphere"].values()
+    elif stage == "extract_production_exchanges":
+        objs = [config["production"]]
+    elif stage == "extract_io_exchanges":
+        objs = [config["technosphere"]]
+    return sorted({obj["filename"] for obj in objs})
+
+
+def package_exiobase(
+    targetdir,
+    version,
+    datafile=None,
+    metafile=None,
+    flush=True,
+    compression="bz2",
+    output_format="csv",
+    hash="md5",
+    workers=1,
+):
+    """Write ``datapackage.json``, and add the files in ``targetdir`` to a tar archive.
+
+    See ``write_archive``; ``hash`` is the hash algorithm, one of ``HASHES``."""
     assert version in version_config.VERSIONS.keys()
+    datapackage = get_datapackage(targetdir, compression, output_format, hash=None)
+    if datafile is None:
+        datafile = get_datafile(targetdir, version)
+    write_archive(targetdir, datapackage, datafile, metafile, flush, hash, workers)
 
-    # delete resource metadata for which no file is present
-    DATAPACKAGE["resources"] = [r for r in DATAPACKAGE["resources"] if (targetdir / r["path"]).exists()]
-
-    # create hash for each resource
-    for resource in DATAPACKAGE["resources"]:
-        resource["hash"] = md5(targetdir / resource["path"])
-
-    # serialize metadata
-    if metafile is None:
-        metafile = targetdir / "datapackage.json"
-    with open(targetdir / metafile, "w") as f:
-        json.dump(DATAPACKAGE, f, indent=2, ensure_ascii=False)
 
-    # add files to tar
-    if datafile is None:
-        datafile = targetdir / "exiobase-{}.tar".format(version.replace(" ", "-"))
-    with tarfile.open(datafile, "w") as tar:
-        for pth in targetdir.iterdir():
-            if pth in [datafile, metafile]:
-                continue
-            else:
-                # add file to tar
-                tar.add(targetdir / pth, arcname=pth.name)
-                # delete file
-                if flush is True:
-                    (targetdir / pth).unlink()
+def get_datapackage(
+    targetdir, compression="bz2", output_format="csv", hash="md5", workers=1
+):
+    """Get the datapackage descriptor for the resource files in ``targetdir``.
 
+    See ``select_resources``; if ``hash`` is ``None``, no hashes are added."""
+    return select_resources(
+        copy.deepcopy(DATAPACKAGE), targetdir, compression, output_format, hash, workers
+    )
 
-def load_metadata(kind, targetdir):
-    filepath = targetdir / (kind + ".csv.bz2")
-    with bz2.open(filepath, "rt") as compressed:
-        data = list(csv.reader(compressed))
-    return data
 
+def get_fields(name):
+    """Get the schema fields of resource ``name`` from ``DATAPACKAGE``"""
+    resource = next(r for r in DATAPACKAGE["resources"] if r["name"] == name)
+    return resource["schema"]["fields"]
 
-def extract_extension_exchanges(sourcedir, targetdir, version):
-    activities = load_metadata("activities", targetdir)
-    extensions = load_metadata("extensions", targetdir)
 
-    dct = VERSIONS[version]["biosphere"]["resource"]
-    resources = read_xlsb(sourcedir / dct["filename"], dct["worksheet"])
+def write_resource(targetdir, name, data, output_format="csv", **kwargs):
+    """Write rows of resource ``name`` to ``targetdir`` as compressed CSV or Parquet.
 
-    dct = VERSIONS[version]["biosphere"]["land_use"]
-    land_uses = read_xlsb(sourcedir / dct["filename"], dct["worksheet"])
+    ``kwargs`` are passed to ``write_compressed_csv``. The time spent in this
+    function, except for producing the rows of ``data``, is recorded as the
+    ``compress`` phase of the running stage."""
+    with get_recorder().phase("compress"):
+        if output_format == "parquet":
+            write_parquet(targetdir / (name + ".parquet"), data, get_fields(name))
+        else:
+            write_compressed_csv(targetdir / name, data, **kwargs)
+
+
+def extract_extension_exchanges(
+    sourcedir,
+    targetdir,
+    version,
+    workers=1,
+    compression="bz2",
+    compresslevel=None,
+    output_format="csv",
+):
+    recorder = get_recorder()
+    activities = load_metadata("activities", targetdir, compression, output_format)
+    extensions = load_metadata("extensions", targetdir, compression, output_format)
 
     def drop_compartment(data):
         """Drop compartment label to get in consistent form with other extension matrices"""
-        return [row[:2] + row[3:] for row in data]
-
-    dct = VERSIONS[version]["biosphere"]["emission"]
-    emissions = drop_compartment(
-        read_xlsb(sourcedir / dct["filename"], dct["worksheet"])
-    )
-
-    # Check to make sure our metadata is valid
-    resource_headers = get_headers(resources, len(activities), 4)
-    land_headers = get_headers(land_uses, len(activities), 4)
-    emission_headers = get_headers(emissions, len(activities), 4)
-
-    assert resource_headers == land_headers == emission_headers
-    # location
-    assert resource_headers[0] == [x[1] for x in activities]
-    # names
-    assert resource_headers[1] == [x[2] for x in activities]
-
-    data = resources + land_uses[4:] + emissions[4:]
-
-    assert [row[1] for row in extensions] == [row[0] for row in data[4:]]
-    assert [row[2] for row in extensions] == [row[1] for row in data[4:]]
-
-    write_compressed_csv(
-        targetdir / "extension-exchanges",
-        get_numeric_data_iterator(data, extensions, activities, only_foreign_keys=True),
-    )
+        return (row[:2] + row[3:] for row in data)
+
+    # All three worksheets are in the same workbook, which is only opened once
+    with WorkbookSession() as session:
+        kinds = ("resource", "land_use", "emission")
+        sheets = [
+            (
+                sourcedir / VERSIONS[version]["biosphere"][kind]["filename"],
+                VERSIONS[version]["biosphere"][kind]["worksheet"],
+            )
+            for kind in kinds
+        ]
+
+        with recorder.phase("parse"):
+            opened = session.iterate_sheets(sheets, workers)
+
+        # Read the headers of each worksheet; the remaining rows are streamed
+        headers, bodies = [], []
+        for kind, data in zip(kinds, opened):
+            data = recorder.iterate(data, "parse", count=True)
+            if kind == "emission":
+                data = drop_compartment(data)
+            sheet_headers, body = split_headers(data, 4)
+            headers.append(get_headers(sheet_headers, len(activities), 4))
+            bodies.append(body)
+
+        # Check to make sure our metadata is valid
+        with recorder.phase("validate"):
+            resource_headers, land_headers, emission_headers = headers
+
+            assert resource_headers == land_headers == emission_headers
+            # location
+            assert resource_headers[0] == [x[1] for x in activities]
+            # names
+            assert resource_headers[1] == [x[2] for x in activities]
+
+        def checked_rows(data):
+            for extension, row in itertools.zip_longest(extensions, data):
+                assert extension is not None and row is not None
+                assert extension[1] == row[0]
+                assert extension[2] == row[1]
+                yield row
+
+        data = recorder.iterate(checked_rows(itertools.chain(*bodies)), "validate")
+
+        write_resource(
+            targetdir,
+            "extension-exchanges",
+            get_sparse_numeric_data_iterator(data, extensions, activities),
+            output_format,
+            workers=workers,
+            compression=compression,
+            compresslevel=compresslevel,
+        )
 
 
-def extract_production_exchanges(sourcedir, targetdir, version):
-    activities = load_metadata("activities", targetdir)
-    products = load_metadata("products", targetdir)
+def extract_production_exchanges(
+    sourcedir,
+    targetdir,
+    version,
+    workers=1,
+    compression="bz2",
+    compresslevel=None,
+    output_format="csv",
+):
+    recorder = get_recorder()
+    activities = load_metadata("activities", targetdir, compression, output_format)
+    products = load_metadata("products", targetdir, compression, output_format)
 
     dct = VERSIONS[version]["production"]
-    if (sourcedir / dct["filename"]).suffix == '.xlsb':
-        data = read_xlsb(sourcedir / dct["filename"], dct["worksheet"])
-        headers = get_headers(data, len(activities), 8)
-    elif (sourcedir / dct["filename"]).suffix == '.csv':
-        data = pandas.read_csv(sourcedir / dct["filename"], header=None).transpose()
-        headers = [data[i].to_list() for i in data.columns]
-
-
-    # activity location
-    assert headers[0] == [x[1] for x in activities]
-    # activity names
-    assert headers[1] == [x[2] for x in activities]
-    # product location
-    assert headers[0] == [x[1] for x in products]
-    # product names
-    assert headers[4] == [x[2] for x in products]
+    with recorder.phase("parse"):
+        if (sourcedir / dct["filename"]).suffix == '.xlsb':
+            # only the header rows and the production row are needed
+            data, _ = split_headers(
+                iterate_xlsb(sourcedir / dct["filename"], dct["worksheet"]), 9
+            )
+            headers = get_headers(data, len(activities), 8)
+            values = data[8][1:]
+            recorder.add(len(data), sum(len(row) for row in data))
+        elif (sourcedir / dct["filename"]).suffix == '.csv':
+            headers, values = read_principal_production_csv(
+                sourcedir / dct["filename"], len(activities)
+            )
+            recorder.add(len(headers) + 1, (len(headers) + 1) * len(values))
+
+    with recorder.phase("validate"):
+        # activity location
+        assert headers[0] == [x[1] for x in activities]
+        # activity names
+        assert headers[1] == [x[2] for x in activities]
+        # product location
+        assert headers[0] == [x[1] for x in products]
+        # product names
+        assert headers[4] == [x[2] for x in products]
 
     def single_row_iterator():
-        for index, value in enumerate(data[8][1:]):
+        for index, value in enumerate(values):
             yield products[index][0], activities[index][0], value
 
-    write_compressed_csv(targetdir / "production-exchanges", single_row_iterator())
+    write_resource(
+        targetdir,
+        "production-exchanges",
+        single_row_iterator(),
+        output_format,
+        workers=workers,
+        compression=compression,
+        compresslevel=compresslevel,
+    )
 
 
-def extract_io_exchanges(sourcedir, targetdir, version, sparse=True):
-    activities = load_metadata("activities", targetdir)
-    products = load_metadata("products", targetdir)
+def extract_io_exchanges(
+    sourcedir,
+    targetdir,
+    version,
+    sparse=True,
+    workers=1,
+    compression="bz2",
+    compresslevel=None,
+    output_format="csv",
+    dense=False,
+):
+    """Extract the technosphere matrix.
+
+    By default, it is written as a sparse ``.npz`` file for CSV sources, and
+    as ``(product, activity, value)`` triples otherwise. If ``dense`` is
+    ``True``, it is written as a dense float64 ``hiot.npy`` matrix instead,
+    with the product and activity ids in ``hiot.row-ids.npy`` and
+    ``hiot.col-ids.npy``. Rows are written as they are read, so the matrix
+    is never held in memory twice."""
+    recorder = get_recorder()
+    activities = load_metadata("activities", targetdir, compression, output_format)
+    products = load_metadata("products", targetdir, compression, output_format)
 
     dct = VERSIONS[version]["technosphere"]
+    if dense:
+        filepath = targetdir / "hiot.npy"
+        write_dense_matrix_labels(
+            filepath, [x[0] for x in products], [x[0] for x in activities]
+        )
 
     # load data
     file = sourcedir / dct["filename"]
     if file.suffix == ".csv":
+        import pandas
+        import scipy.sparse
 
         # read data
-        df = pandas.read_csv(file, index_col=list(range(5)), header=list(range(4)))
+        with recorder.phase("parse"):
+            df = pandas.read_csv(
+                file, index_col=list(range(5)), header=list(range(4))
+            )
+            recorder.add(df.shape[0], df.size)
 
         # name indices and columns
         df.index.names = ['location', 'product', 'product code 1', 'product code 2', 'unit']
         df.columns.names = ['location', 'activity', 'activity code 1', 'activity code 2']
 
         # check if order of locations and products is correct
-        # activity locations
-        assert df.columns.get_level_values('location').to_list() == [x[1] for x in activities]
-        # activity names
-        assert df.columns.get_level_values('activity').to_list() == [x[2] for x in activities]
-        # product location
-        assert df.index.get_level_values('location').to_list() == [x[1] for x in products]
-        # product name
-        assert df.index.get_level_values('product').to_list() == [x[2] for x in products]
-
-        # write sparse matrix to npz
-        if sparse is True:
-            sparse_matrix = scipy.sparse.coo_matrix(df.values)
-            scipy.sparse.save_npz(targetdir / "hiot.npz", sparse_matrix)
-        # write dense matrix to compressed csv
-        else:
-            with bz2.open(targetdir / "hiot.csv.bz2", "wt", newline="") as compressed:
-                writer = csv.writer(compressed)
-                writer.writerows(df.values)
+        with recorder.phase("validate"):
+            # activity locations
+            assert df.columns.get_level_values('location').to_list() == [x[1] for x in activities]
+            # activity names
+            assert df.columns.get_level_values('activity').to_list() == [x[2] for x in activities]
+            # product location
+            assert df.index.get_level_values('location').to_list() == [x[1] for x in products]
+            # product name
+            assert df.index.get_level_values('product').to_list() == [x[2] for x in products]
+
+        with recorder.phase("compress"):
+            # write dense matrix to npy
+            if dense:
+                matrix = open_dense_matrix(filepath, (len(products), len(activities)))
+                matrix[:] = df.values
+                matrix.flush()
+            # write sparse matrix to parquet
+            elif output_format == "parquet":
+                write_parquet_matrix(
+                    targetdir / "hiot.parquet",
+                    scipy.sparse.coo_matrix(df.values),
+                    [x[0] for x in products],
+                    [x[0] for x in activities],
+                    get_fields("hiot"),
+                )
+            # write sparse matrix to npz
+            elif sparse is True:
+                sparse_matrix = scipy.sparse.coo_matrix(df.values)
+                scipy.sparse.save_npz(targetdir / "hiot.npz", sparse_matrix)
+            # write dense matrix to compressed csv
+            else:
+                write_compressed_csv(
+                    targetdir / "hiot",
+                    df.values,
+                    workers=workers,
+                    compression=compression,
+                    compresslevel=compresslevel,
+                )
     else:
-        wb = pyxlsb.open_workbook(str(sourcedir / dct["filename"]))
-        sheet = iter(wb.get_sheet(dct["worksheet"]))
-
-        def next_row(sheet):
-            return [o.v for o in next(sheet)]
-
-        headers = [next_row(sheet)[5:] for _ in range(4)]
-
-        # activity location
-        assert headers[0] == [x[1] for x in activities]
-        # activity names
-        assert headers[1] == [x[2] for x in activities]
+        headers, sheet = split_headers(
+            recorder.iterate(
+                iterate_xlsb(sourcedir / dct["filename"], dct["worksheet"]),
+                "parse",
+                count=True,
+            ),
+            4,
+        )
+        headers = [row[5:] for row in headers]
 
-        with bz2.open(targetdir / "hiot.csv.bz2", "wt", newline="") as compressed:
-            writer = csv.writer(compressed)
+        with recorder.phase("validate"):
+            # activity location
+            assert headers[0] == [x[1] for x in activities]
+            # activity names
+            assert headers[1] == [x[2] for x in activities]
 
-            for row_index, row_raw in enumerate(sheet):
+        def checked_rows():
+            for row_index, row in enumerate(sheet):
                 if not row_index % 250:
-                    print("{} / {}".format(row_index, len(activities)))
+                    logger.debug("hiot row %d / %d", row_index, len(products))
 
-                row = [o.v for o in row_raw]
                 assert row[0] == products[row_index][1]
                 assert row[1] == products[row_index][2]
-
-                for col_index, value in enumerate(row[5:]):
-                    if value:
-                        writer.writerow(
-                            (products[row_index][0], activities[col_index][0], value)
-                        )
-
-
-def extract_metadata(sourcedir, targetdir, version):
+                yield row
+
+        rows = recorder.iterate(checked_rows(), "validate")
+        if dense:
+            matrix = open_dense_matrix(filepath, (len(products), len(activities)))
+            row_count = 0
+            with recorder.phase("compress"):
+                for row_index, row in enumerate(rows):
+                    # empty cells are None
+                    matrix[row_index] = [
+                        value or 0 for value in row[len(row) - len(activities) :]
+                    ]
+                    row_count += 1
+                matrix.flush()
+            assert row_count == len(products)
+        else:
+            write_resource(
+                targetdir,
+                "hiot",
+                get_sparse_numeric_data_iterator(rows, products, activities),
+                output_format,
+                workers=workers,
+                compression=compression,
+                compresslevel=compresslevel,
+            )
+
+
+def extract_metadata(
+    sourcedir,
+    targetdir,
+    version,
+    workers=1,
+    compression="bz2",
+    compresslevel=None,
+    output_format="csv",
+):
     def reformat_extension(record, obj):
-        return (
-            "{}-{}".format(obj["kind"], record["name"]),
-            record["name"],
-            record["unit"],
-            record.get("compartment"),
-            obj["kind"],
-        )
+        name, unit, compartment = record
+        return ("{}-{}".format(obj["kind"], name), name, unit, compartment, obj["kind"])
 
     def reformat_location(record, obj):
-        return (record["code"], record["name"])
+        return record
 
     def reformat_activity(record, obj):
-        return (
-            "{}-{}".format(record["location"], record["name"]),
-            record["location"],
-            record["name"],
-            record["code 1"],
-            record["code 2"],
-        )
-
-    def reformat_product(record, obj):
-        return (
-            "{}-{}".format(record["location"], record["name"]),
-            record["location"],
-            record["name"],
-            record["code 1"],
-            record["code 2"],
-            record["unit"],
-        )
+        # Id is location and name, e.g. "AT-Cultivation of wheat"
+        return ("{}-{}".format(*record[:2]),) + record
 
+    # Fields read from each worksheet, in the order of the output columns;
+    # the column names are translated to fields with the version ``mapping``
     config = {
-        "extensions": reformat_extension,
-        "locations": reformat_location,
-        "products": reformat_product,
-        "activities": reformat_activity,
+        "extensions": (reformat_extension, ("name", "unit", "compartment")),
+        "locations": (reformat_location, ("code", "name")),
+        "products": (
+            reformat_activity,
+            ("location", "name", "code 1", "code 2", "unit"),
+        ),
+        "activities": (reformat_activity, ("location", "name", "code 1", "code 2")),
     }
 
-    for kind, func in config.items():
-        data = []
-        for obj in VERSIONS[version]["nomenclature"][kind]:
-            mapping = obj["mapping"]
-            for record in extract_with_pandas(
-                sourcedir / obj["filename"], obj["worksheet"]
-            ):
-                record = {mapping[k.strip()]: v for k, v in record.items()}
-                data.append(func(record, obj))
-        write_compressed_csv(targetdir / kind, data)
+    recorder = get_recorder()
+
+    # The nomenclature worksheets share one workbook, which is only opened once
+    with WorkbookSession() as session:
+        for kind, (func, fields) in config.items():
+            data = []
+            for obj in VERSIONS[version]["nomenclature"][kind]:
+                records = session.iterate_columns(
+                    sourcedir / obj["filename"],
+                    obj["worksheet"],
+                    obj["mapping"],
+                    fields,
+                )
+                for record in recorder.iterate(records, "parse", count=True):
+                    data.append(func(record, obj))
+            write_resource(
+                targetdir,
+                kind,
+                data,
+                output_format,
+                workers=workers,
+                compression=compression,
+                compresslevel=compresslevel,
+            )
@@ -214,5 +214,62 @@ References:
                 },
             ],
         },
+        # OR (writing hiot to a dense npy matrix, with the id sidecars
+        # hiot-row-ids and hiot-col-ids below)
+        {
+            "name": "hiot",
+            "path": "hiot.npy",
+            "profile": "data-resource",
+            "mediatype": "application/octet-stream",
+            "title": "Values from Input-Output table (excluding production)",
+            "format": "npy",
+            "schema": {
+                "fields": [
+                    {"name": "product"},
+                    {"name": "activity"},
+                    {"name": "value", "type": "number"},
+                ]
+            },
+            "foreignKeys": [
+                {
+                    "fields": "product",
+                    "reference": {"resource": "products", "fields": "id"},
+                },
+                {
+                    "fields": "activity",
+                    "reference": {"resource": "activities", "fields": "id"},
+                },
+            ],
+        },
+        {
+            "name": "hiot-row-ids",
+            "path": "hiot.row-ids.npy",
+            "profile": "data-resource",
+            "mediatype": "application/octet-stream",
+            "title": "Product ids of the rows of the dense Input-Output table",
+            "format": "npy",
+            "schema": {"fields": [{"name": "product"}]},
+            "foreignKeys": [
+                {
+                    "fields": "product",
+                    "reference": {"resource": "products", "fields": "id"},
+                },
+            ],
+        },
+        {
+            "name": "hiot-col-ids",
+            "path": "hiot.col-ids.npy",
+            "profile": "data-resource",
+            "mediatype": "application/octet-stream",
+            "title": "Activity ids of the columns of the dense Input-Output table",
+            "format": "npy",
+            "schema": {"fields": [{"name": "activity"}]},
+            "foreignKeys": [
+                {
+                    "fields": "activity",
+                    "reference": {"resource": "activities", "fields": "id"},
+                },
+            ],
+        },
     ],
 }
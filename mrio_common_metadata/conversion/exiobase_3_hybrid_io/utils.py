@@ -1,18 +1,22 @@
+from ..utils import get_headers
 from pathlib import Path
 import bz2
 import csv
 import hashlib
-import pandas as pd
-import pyxlsb
+import itertools
 
 
 def read_xlsb(filepath, worksheet):
+    import pyxlsb
+
     wb = pyxlsb.open_workbook(str(filepath))
     sheet = wb.get_sheet(worksheet)
     return [[o.v for o in row] for row in sheet.rows()]
 
 
 def convert_xlsb(workbook, worksheet, sourcedir, targetdir):
+    import pyxlsb
+
     wb = pyxlsb.open_workbook(workbook)
     sheet = wb.get_sheet(worksheet)
 
@@ -28,18 +32,9 @@ def convert_xlsb(workbook, worksheet, sourcedir, targetdir):
 
 
 def extract_with_pandas(filepath, worksheet):
-    return pd.read_excel(filepath, sheet_name=worksheet).to_dict(orient="records")
-
+    import pandas as pd
 
-def write_compressed_csv(filepath, data):
-    filepath = str(filepath)
-    if not filepath.endswith(".csv.bz2"):
-        filepath += ".csv.bz2"
-
-    with bz2.open(filepath, "wt", newline="") as compressed:
-        writer = csv.writer(compressed)
-        for row in data:
-            writer.writerow(row)
+    return pd.read_excel(filepath, sheet_name=worksheet).to_dict(orient="records")
 
 
 def get_numeric_data_iterator(
@@ -56,8 +51,22 @@ def get_numeric_data_iterator(
                     yield (rows[row_index], cols[col_index], value)
 
 
-def get_headers(data, cols, rows):
-    return [row[-cols:] for row in data[:rows]]
+def read_principal_production_csv(filepath, cols):
+    """Read ``(headers, values)`` from a principal production CSV file.
+
+    The file has the layout of the principal production worksheet: eight
+    label rows, then one row of values, each with a label in the first
+    column and one column for each of the ``cols`` activities."""
+    with open(filepath, newline="") as f:
+        data = list(itertools.islice(csv.reader(f), 9))
+    if len(data) != 9 or any(len(row) != cols + 1 for row in data):
+        raise ValueError(
+            "Unexpected layout of {}: expected 9 rows of {} cells (a label and "
+            "one cell for each activity), got {} rows of {} cells".format(
+                filepath, cols + 1, len(data), sorted({len(row) for row in data})
+            )
+        )
+    return get_headers(data, cols, 8), [float(value or 0) for value in data[8][1:]]
 
 
 def md5(filepath, blocksize=65536):
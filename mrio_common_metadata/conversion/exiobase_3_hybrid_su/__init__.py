@@ -1,209 +1,534 @@
 from .datapackage import DATAPACKAGE
-from .utils import (
+from .utils import build_sparse_matrix
+from .version_config import VERSIONS
+from ..instrumentation import get_recorder
+from ..pipeline import (
+    get_datafile,
+    load_metadata,
+    run_conversion,
+    select_resources,
+    write_archive,
+)
+from ..utils import (
     write_compressed_csv,
-    extract_with_pandas,
-    read_xlsb,
-    get_numeric_data_iterator,
     get_headers,
-    md5,
+    get_sparse_numeric_data_iterator,
+    split_headers,
+    WorkbookSession,
 )
-from .version_config import VERSIONS
-from pathlib import Path
-import bz2
-import csv
-import json
-import pyxlsb
-import tarfile
-
-
-DATA_DIR = Path(__file__, "..").resolve() / "data"
-DATA_DIR.mkdir(exist_ok=True)
-
-
-def convert_exiobase(sourcedir, version="3.3.17 hybrid"):
-    sourcedir = Path(sourcedir)
-    extract_metadata(sourcedir, version)
-    extract_extension_exchanges(sourcedir, version)
-    extract_production_exchanges(sourcedir, version)
-    extract_io_exchanges(sourcedir, version)
-    package_exiobase(version)
-
-
-def package_exiobase(version):
-    assert version == "3.3.17 hybrid"
-    for resource in DATAPACKAGE["resources"]:
-        resource["hash"] = md5(DATA_DIR / resource["path"])
-
-    with open(DATA_DIR / "datapackage.json", "w") as f:
-        json.dump(DATAPACKAGE, f, indent=2, ensure_ascii=False)
-
-    fp = DATA_DIR / "exiobase-{}.tar".format(version.relocation(" ", "-"))
-
-    with tarfile.open(fp, "w") as tar:
-        for pth in DATA_DIR.iterdir():
-            tar.add(DATA_DIR / pth, arcname=pth.name)
-
-
-def load_metadata(kind):
-    filepath = DATA_DIR / (kind + ".csv.bz2")
-    with bz2.open(filepath, "rt") as compressed:
-        data = list(csv.reader(compressed))
-    return data
-
-
-def extract_extension_exchanges(sourcedir, version):
-    activities = load_metadata("activities")
-    extensions = load_metadata("extensions")
-
-    dct = VERSIONS[version]["biosphere"]["resource"]
-    resources = read_xlsb(sourcedir / dct["filename"], dct["worksheet"])
-
-    dct = VERSIONS[version]["biosphere"]["land_use"]
-    land_uses = read_xlsb(sourcedir / dct["filename"], dct["worksheet"])
-
-    def drop_compartment(data):
-        """Drop compartment label to get in consistent form with other extension matrices"""
-        return [row[:2] + row[3:] for row in data]
-
-    dct = VERSIONS[version]["biosphere"]["emission"]
-    emissions = drop_compartment(
-        read_xlsb(sourcedir / dct["filename"], dct["worksheet"])
+from ...utils import write_parquet
+import copy
+import itertools
+
+
+def convert_exiobase(
+    sourcedir,
+    targetdir=None,
+    version="3.3.17 hybrid",
+    workers=1,
+    compression="bz2",
+    compresslevel=None,
+    output_format="csv",
+    resume=True,
+    hash="md5",
+    callback=None,
+    profile=None,
+    profiler="cprofile",
+    sparse=True,
+):
+    """Convert EXIOBASE hybrid SU source files to a datapackage in ``targetdir``.
+
+    The supply, use, final demand and stock to waste tables, and the
+    extension worksheets, are streamed one row at a time. If ``sparse`` is
+    ``True``, each table is written as a ``scipy.sparse`` npz file, and only
+    its non-zero values are held in memory; the four SU tables share the
+    order of the ``products`` resource for their rows, and of the
+    ``activities`` or ``final-demand-categories`` resources for their
+    columns (see ``get_supply_use_tables``). Otherwise, the non-zero values
+    are written as ``(row, column, value)`` triples in ``output_format`` as
+    they are read, and memory use doesn't grow with the size of the tables.
+
+    ``workers`` is the number of processes to use. With more than one worker,
+    the supply, use, final demand and extension exchanges are extracted
+    concurrently once the metadata is available, and the remaining workers
+    are shared out to compress output files. The other options are as in
+    the hybrid IO ``convert_exiobase``."""
+    stages = [
+        extract_supply_exchanges,
+        extract_use_exchanges,
+        extract_final_demand_exchanges,
+        extract_extension_exchanges,
+    ]
+    return run_conversion(
+        sourcedir,
+        targetdir,
+        version,
+        extract_metadata,
+        stages,
+        package_exiobase,
+        STAGE_OUTPUTS,
+        get_stage_sources,
+        workers=workers,
+        compression=compression,
+        compresslevel=compresslevel,
+        output_format=output_format,
+        resume=resume,
+        hash=hash,
+        callback=callback,
+        profile=profile,
+        profiler=profiler,
+        # the numeric stages also choose the table format
+        stage_options={stage.__name__: {"sparse": sparse} for stage in stages},
     )
 
-    # Check to make sure our metadata is valid
-    resource_headers = get_headers(resources, len(activities), 4)
-    land_headers = get_headers(land_uses, len(activities), 4)
-    emission_headers = get_headers(emissions, len(activities), 4)
-
-    assert resource_headers == land_headers == emission_headers
-    # location
-    assert resource_headers[0] == [x[1] for x in activities]
-    # names
-    assert resource_headers[1] == [x[2] for x in activities]
 
-    data = resources + land_uses[4:] + emissions[4:]
+def get_extension_resource_name(obj):
+    """Get the resource name of an extension worksheet, e.g. ``extensions-land-act``"""
+    return "extensions-" + obj["worksheet"].lower().replace("_", "-")
+
+
+def is_final_demand_worksheet(obj):
+    """Check if the columns of an extension worksheet are final demand categories.
+
+    Other extension worksheets have one column per activity."""
+    return obj["worksheet"].lower().endswith("fd")
+
+
+def get_extension_resource(obj, sparse=False):
+    """Get the datapackage resource for an extension worksheet in ``VERSIONS``.
+
+    If ``sparse`` is ``True``, the resource is a ``scipy.sparse`` npz file."""
+    if is_final_demand_worksheet(obj):
+        field, reference = "category", "final-demand-categories"
+    else:
+        field, reference = "activity", "activities"
+    name = get_extension_resource_name(obj)
+    if sparse:
+        file = {
+            "path": name + ".npz",
+            "profile": "data-resource",
+            "mediatype": "application/octet-stream",
+            "format": "npz",
+        }
+    else:
+        file = {
+            "path": name + ".csv.bz2",
+            "profile": "tabular-data-resource",
+            "mediatype": "text/csv+bz2",
+            "format": "csv",
+        }
+    return {
+        "name": name,
+        "path": file["path"],
+        "profile": file["profile"],
+        "mediatype": file["mediatype"],
+        "title": "Extension exchange values ({})".format(obj["worksheet"]),
+        "format": file["format"],
+        "schema": {
+            "fields": [
+                {"name": "extension"},
+                {"name": field},
+                {"name": "value", "type": "number"},
+            ]
+        },
+        "foreignKeys": [
+            {
+                "fields": "extension",
+                "reference": {"resource": "extensions", "fields": "id"},
+            },
+            {"fields": field, "reference": {"resource": reference, "fields": "id"}},
+        ],
+    }
 
-    assert [row[1] for row in extensions] == [row[0] for row in data[4:]]
-    assert [row[2] for row in extensions] == [row[1] for row in data[4:]]
 
-    write_compressed_csv(
-        DATA_DIR / "extension-exchanges",
-        get_numeric_data_iterator(data, extensions, activities, only_foreign_keys=True),
+def get_resources(version):
+    """Get the resources of ``version``, with one for each extension worksheet.
+
+    Like ``DATAPACKAGE``, there are alternative resources for each numeric
+    resource, as triples or as sparse matrices."""
+    return copy.deepcopy(DATAPACKAGE["resources"]) + [
+        get_extension_resource(obj, sparse)
+        for sparse in (False, True)
+        for obj in VERSIONS[version]["biosphere"].values()
+    ]
+
+
+# Resources written by each conversion stage
+STAGE_OUTPUTS = {
+    "extract_metadata": [
+        "extensions",
+        "locations",
+        "products",
+        "activities",
+        "final-demand-categories",
+    ],
+    "extract_supply_exchanges": ["supply"],
+    "extract_use_exchanges": ["use"],
+    "extract_final_demand_exchanges": ["final-demand", "stock-to-waste"],
+    "extract_extension_exchanges": sorted(
+        {
+            get_extension_resource_name(obj)
+            for config in VERSIONS.values()
+            for obj in config["biosphere"].values()
+        }
+    ),
+}
+
+
+def get_stage_sources(version, stage):
+    """Get the source filenames read by conversion ``stage``"""
+    config = VERSIONS[version]
+    if stage == "extract_metadata":
+        # final demand categories are read from the final demand worksheet
+        objs = itertools.chain(
+            *config["nomenclature"].values(), [config["final demand"]]
+        )
+    elif stage == "extract_supply_exchanges":
+        objs = [config["supply"]]
+    elif stage == "extract_use_exchanges":
+        objs = [config["use"]]
+    elif stage == "extract_final_demand_exchanges":
+        objs = [config["final demand"], config["stock to waste"]]
+    elif stage == "extract_extension_exchanges":
+        objs = config["biosphere"].values()
+    return sorted({obj["filename"] for obj in objs})
+
+
+def package_exiobase(
+    targetdir,
+    version,
+    datafile=None,
+    metafile=None,
+    flush=True,
+    compression="bz2",
+    output_format="csv",
+    hash="md5",
+    workers=1,
+):
+    """Write ``datapackage.json``, and add the files in ``targetdir`` to a tar archive.
+
+    See ``write_archive``."""
+    assert version in VERSIONS
+    datapackage = get_datapackage(
+        targetdir, version, compression, output_format, hash=None
     )
-
-
-def extract_su_exchanges(sourcedir, version, kind):
-    activities = load_metadata("activities")
-    products = load_metadata("products")
-
-    dct = VERSIONS[version][kind]
-    data = read_xlsb(
-        sourcedir / dct["filename"],
-        dct["worksheet"],
-        pbar_total=len(activities) * len(products) + 4
+    if datafile is None:
+        datafile = get_datafile(targetdir, version)
+    write_archive(targetdir, datapackage, datafile, metafile, flush, hash, workers)
+
+
+def get_datapackage(
+    targetdir,
+    version="3.3.17 hybrid",
+    compression="bz2",
+    output_format="csv",
+    hash="md5",
+    workers=1,
+):
+    """Get the datapackage descriptor for the resource files in ``targetdir``.
+
+    See ``select_resources``; if ``hash`` is ``None``, no hashes are added."""
+    datapackage = copy.deepcopy(DATAPACKAGE)
+    datapackage["resources"] = get_resources(version)
+    return select_resources(
+        datapackage, targetdir, compression, output_format, hash, workers
     )
 
-    headers = get_headers(data, len(activities), 8)
-
-    # activity location
-    assert headers[0] == [x[1] for x in activities]
-    # activity names
-    assert headers[1] == [x[2] for x in activities]
-    # product location
-    assert headers[0] == [x[1] for x in products]
-    # product names
-    assert headers[4] == [x[2] for x in products]
-
-    def single_row_iterator():
-        for index, value in enumerate(data[8][1:]):
-            yield products[index][0], activities[index][0], value
-
-    write_compressed_csv(DATA_DIR / "production-exchanges", single_row_iterator())
-
-
-def extract_io_exchanges(sourcedir, version):
-    activities = load_metadata("activities")
-    products = load_metadata("products")
-
-    dct = VERSIONS[version]["technosphere"]
-
-    wb = pyxlsb.open_workbook(str(sourcedir / dct["filename"]))
-    sheet = iter(wb.get_sheet(dct["worksheet"]))
-
-    def next_row(sheet):
-        return [o.v for o in next(sheet)]
-
-    headers = [next_row(sheet)[5:] for _ in range(4)]
-
-    # activity location
-    assert headers[0] == [x[1] for x in activities]
-    # activity names
-    assert headers[1] == [x[2] for x in activities]
-
-    with bz2.open(DATA_DIR / "hiot.csv.bz2", "wt", newline="") as compressed:
-        writer = csv.writer(compressed)
 
-        for row_index, row_raw in enumerate(sheet):
-            if not row_index % 250:
-                print("{} / {}".format(row_index, len(activities)))
-
-            row = [o.v for o in row_raw]
-            assert row[0] == products[row_index][1]
-            assert row[1] == products[row_index][2]
-
-            for col_index, value in enumerate(row[5:]):
-                if value:
-                    writer.writerow(
-                        (products[row_index][0], activities[col_index][0], value)
-                    )
+def write_resource(
+    targetdir, resource, data, output_format="csv", version="3.3.17 hybrid", **kwargs
+):
+    """Write rows of ``resource`` to ``targetdir`` as compressed CSV or Parquet.
+
+    ``kwargs`` are passed to ``write_compressed_csv``. The time spent in this
+    function, except for producing the rows of ``data``, is recorded as the
+    ``compress`` phase of the running stage."""
+    with get_recorder().phase("compress"):
+        if output_format == "parquet":
+            fields = next(
+                r["schema"]["fields"]
+                for r in get_resources(version)
+                if r["name"] == resource
+            )
+            write_parquet(targetdir / (resource + ".parquet"), data, fields)
+        else:
+            write_compressed_csv(targetdir / resource, data, **kwargs)
+
+
+def iterate_checked_rows(data, rows, cols):
+    """Validate the labels of a worksheet, and iterate over the rows below its headers.
+
+    ``data`` is an iterator over the rows of the worksheet, with four header
+    rows holding the location, name and codes of ``cols``. The first two
+    row label columns of each other row must match fields 1 and 2 of
+    ``rows`` (location and name of products, or name and unit of
+    extensions). Rows are validated one at a time, as they are consumed."""
+    recorder = get_recorder()
+    headers, body = split_headers(data, 4)
+    headers = get_headers(headers, len(cols), 4)
+
+    with recorder.phase("validate"):
+        # column location (or extension name)
+        assert headers[0] == [x[1] for x in cols]
+        # column names
+        assert headers[1] == [x[2] for x in cols]
+
+    def checked_rows():
+        for label, row in itertools.zip_longest(rows, body):
+            assert label is not None and row is not None
+            assert row[0] == label[1]
+            assert row[1] == label[2]
+            yield row
+
+    return recorder.iterate(checked_rows(), "validate")
+
+
+def write_exchanges(
+    targetdir,
+    resource,
+    data,
+    rows,
+    cols,
+    sparse=True,
+    output_format="csv",
+    version="3.3.17 hybrid",
+    all_rows=None,
+    **kwargs
+):
+    """Write the rows of a worksheet below its headers as resource ``resource``.
+
+    If ``sparse`` is ``True``, the values are written as a ``scipy.sparse``
+    CSR matrix in ``resource.npz``, whose rows and columns are in the order
+    of the metadata ``rows`` and ``cols``. If the worksheet only has some of
+    the rows of a metadata resource, e.g. the extensions of one kind,
+    ``all_rows`` are the rows of the matrix, and the others are empty.
+    Otherwise, the non-zero values are written as ``(row id, col id,
+    value)`` triples with ``write_resource``."""
+    if not sparse:
+        write_resource(
+            targetdir,
+            resource,
+            get_sparse_numeric_data_iterator(data, rows, cols),
+            output_format,
+            version,
+            **kwargs,
+        )
+        return
+
+    import numpy as np
+    import scipy.sparse
+
+    with get_recorder().phase("compress"):
+        matrix = build_sparse_matrix(data, rows, cols)
+        if all_rows is not None:
+            positions = {row[0]: index for index, row in enumerate(all_rows)}
+            mapping = np.array([positions[row[0]] for row in rows], dtype=np.int64)
+            matrix = matrix.tocoo()
+            matrix = scipy.sparse.csr_matrix(
+                (matrix.data, (mapping[matrix.row], matrix.col)),
+                shape=(len(all_rows), len(cols)),
+            )
+        scipy.sparse.save_npz(targetdir / (resource + ".npz"), matrix)
+
+
+def extract_exchanges(
+    sourcedir,
+    targetdir,
+    version,
+    kinds,
+    columns,
+    sparse=True,
+    workers=1,
+    compression="bz2",
+    compresslevel=None,
+    output_format="csv",
+):
+    """Extract the tables ``kinds`` in ``VERSIONS``, with products as rows.
+
+    ``columns`` is the name of the metadata resource of the table columns.
+    Tables are written with ``write_exchanges``, so all tables with the same
+    ``columns`` share one product and one column index.
+
+    Worksheets in the same workbook share one ``WorkbookSession``, and are
+    decompressed in parallel threads with more than one worker."""
+    recorder = get_recorder()
+    products = load_metadata("products", targetdir, compression, output_format)
+    cols = load_metadata(columns, targetdir, compression, output_format)
+
+    with WorkbookSession() as session:
+        sheets = [
+            (
+                sourcedir / VERSIONS[version][kind]["filename"],
+                VERSIONS[version][kind]["worksheet"],
+            )
+            for kind in kinds
+        ]
+        with recorder.phase("parse"):
+            opened = session.iterate_sheets(sheets, workers)
+
+        for kind, data in zip(kinds, opened):
+            write_exchanges(
+                targetdir,
+                kind.replace(" ", "-"),
+                iterate_checked_rows(
+                    recorder.iterate(data, "parse", count=True), products, cols
+                ),
+                products,
+                cols,
+                sparse,
+                output_format,
+                version,
+                workers=workers,
+                compression=compression,
+                compresslevel=compresslevel,
+            )
+
+
+def extract_supply_exchanges(sourcedir, targetdir, version, **kwargs):
+    extract_exchanges(sourcedir, targetdir, version, ["supply"], "activities", **kwargs)
+
+
+def extract_use_exchanges(sourcedir, targetdir, version, **kwargs):
+    extract_exchanges(sourcedir, targetdir, version, ["use"], "activities", **kwargs)
+
+
+def extract_final_demand_exchanges(sourcedir, targetdir, version, **kwargs):
+    extract_exchanges(
+        sourcedir,
+        targetdir,
+        version,
+        ["final demand", "stock to waste"],
+        "final-demand-categories",
+        **kwargs,
+    )
 
 
-def extract_metadata(sourcedir, version):
+def extract_extension_exchanges(
+    sourcedir,
+    targetdir,
+    version,
+    sparse=True,
+    workers=1,
+    compression="bz2",
+    compresslevel=None,
+    output_format="csv",
+):
+    """Extract one resource per extension worksheet.
+
+    The rows of each worksheet are the extensions of its ``type``, and the
+    columns either activities or final demand categories. Sparse matrices
+    (see ``write_exchanges``) have one row for each extension, in the order
+    of the ``extensions`` resource, and only the rows of this ``type`` have
+    values."""
+    recorder = get_recorder()
+    activities = load_metadata("activities", targetdir, compression, output_format)
+    categories = load_metadata(
+        "final-demand-categories", targetdir, compression, output_format
+    )
+    extensions = load_metadata("extensions", targetdir, compression, output_format)
+
+    objs = list(VERSIONS[version]["biosphere"].values())
+    # All worksheets are in the same workbook, which is only opened once
+    with WorkbookSession() as session:
+        with recorder.phase("parse"):
+            opened = session.iterate_sheets(
+                [(sourcedir / obj["filename"], obj["worksheet"]) for obj in objs],
+                workers,
+            )
+
+        for obj, data in zip(objs, opened):
+            rows = [x for x in extensions if x[4] == obj["type"]]
+            cols = categories if is_final_demand_worksheet(obj) else activities
+            write_exchanges(
+                targetdir,
+                get_extension_resource_name(obj),
+                iterate_checked_rows(
+                    recorder.iterate(data, "parse", count=True), rows, cols
+                ),
+                rows,
+                cols,
+                sparse,
+                output_format,
+                version,
+                all_rows=extensions,
+                workers=workers,
+                compression=compression,
+                compresslevel=compresslevel,
+            )
+
+
+def extract_metadata(
+    sourcedir,
+    targetdir,
+    version,
+    workers=1,
+    compression="bz2",
+    compresslevel=None,
+    output_format="csv",
+):
     def reformat_extension(record, obj):
-        return (
-            "{}-{}".format(obj["kind"], record["name"]),
-            record["name"],
-            record["unit"],
-            record.get("compartment"),
-            obj["kind"],
-        )
+        name, unit, compartment = record
+        return ("{}-{}".format(obj["kind"], name), name, unit, compartment, obj["kind"])
 
     def reformat_location(record, obj):
-        return (record["code"], record["name"])
+        return record
 
     def reformat_activity(record, obj):
-        return (
-            "{}-{}".format(record["location"], record["name"]),
-            record["location"],
-            record["name"],
-            record["code 1"],
-            record["code 2"],
-        )
-
-    def reformat_product(record, obj):
-        return (
-            "{}-{}".format(record["location"], record["name"]),
-            record["location"],
-            record["name"],
-            record["code 1"],
-            record["code 2"],
-            record["unit"],
-        )
+        # Id is location and name, e.g. "AT-Cultivation of wheat"
+        return ("{}-{}".format(*record[:2]),) + record
 
+    # Fields read from each worksheet, in the order of the output columns;
+    # the column names are translated to fields with the version ``mapping``
     config = {
-        "extensions": reformat_extension,
-        "locations": reformat_location,
-        "products": reformat_product,
-        "activities": reformat_activity,
+        "extensions": (reformat_extension, ("name", "unit", "compartment")),
+        "locations": (reformat_location, ("code", "name")),
+        "products": (
+            reformat_activity,
+            ("location", "name", "code 1", "code 2", "unit"),
+        ),
+        "activities": (reformat_activity, ("location", "name", "code 1", "code 2")),
     }
 
-    for kind, func in config.items():
-        data = []
-        for obj in VERSIONS[version]["nomenclature"][kind]:
-            mapping = obj["mapping"]
-            for record in extract_with_pandas(
-                sourcedir / obj["filename"], obj["worksheet"]
-            ):
-                record = {mapping[k.strip()]: v for k, v in record.items()}
-                data.append(func(record, obj))
-        write_compressed_csv(DATA_DIR / kind, data)
+    recorder = get_recorder()
+    options = {
+        "workers": workers,
+        "compression": compression,
+        "compresslevel": compresslevel,
+    }
+
+    # The nomenclature worksheets share one workbook, which is only opened once
+    with WorkbookSession() as session:
+        for kind, (func, fields) in config.items():
+            data = []
+            for obj in VERSIONS[version]["nomenclature"][kind]:
+                records = session.iterate_columns(
+                    sourcedir / obj["filename"],
+                    obj["worksheet"],
+                    obj["mapping"],
+                    fields,
+                )
+                for record in recorder.iterate(records, "parse", count=True):
+                    data.append(func(record, obj))
+            write_resource(targetdir, kind, data, output_format, version, **options)
+
+        # Final demand categories are only listed in the column headers of
+        # the final demand worksheet: one header row each for the location,
+        # name and two codes. Only these rows are read.
+        dct = VERSIONS[version]["final demand"]
+        with recorder.phase("parse"):
+            rows = session.iterate_xlsb(sourcedir / dct["filename"], dct["worksheet"])
+            headers, _ = split_headers(rows, 4)
+            recorder.add(len(headers), sum(len(row) for row in headers))
+        # Row labels are the product fields, in the first five columns
+        categories = [
+            reformat_activity(record, dct)
+            for record in zip(*[row[5:] for row in headers])
+        ]
+        write_resource(
+            targetdir,
+            "final-demand-categories",
+            categories,
+            output_format,
+            version,
+            **options,
+        )
@@ -62,7 +62,7 @@ References:
             "path": "products.csv.bz2",
             "profile": "tabular-data-resource",
             "mediatype": "text/csv+bz2",
-            "title": "Products (for HIOT)",
+            "title": "Products",
             "format": "csv",
             "schema": {
                 "fields": [
@@ -108,23 +108,42 @@ References:
             },
         },
         {
-            "name": "extension-exchanges",
-            "path": "extension-exchanges.csv.bz2",
+            "name": "final-demand-categories",
+            "path": "final-demand-categories.csv.bz2",
             "profile": "tabular-data-resource",
             "mediatype": "text/csv+bz2",
-            "title": "Extension exchange values",
+            "title": "Final demand categories",
+            "description": "Read from the column headers of the final demand worksheet",
             "format": "csv",
             "schema": {
                 "fields": [
-                    {"name": "extension"},
+                    {"name": "id"},
+                    {"name": "location"},
+                    {"name": "name"},
+                    {"name": "code 1"},
+                    {"name": "code 2"},
+                ],
+                "primaryKey": "id",
+            },
+        },
+        {
+            "name": "supply",
+            "path": "supply.csv.bz2",
+            "profile": "tabular-data-resource",
+            "mediatype": "text/csv+bz2",
+            "title": "Supply table",
+            "format": "csv",
+            "schema": {
+                "fields": [
+                    {"name": "product"},
                     {"name": "activity"},
                     {"name": "value", "type": "number"},
                 ]
             },
             "foreignKeys": [
                 {
-                    "fields": "extension",
-                    "reference": {"resource": "extensions", "fields": "id"},
+                    "fields": "product",
+                    "reference": {"resource": "products", "fields": "id"},
                 },
                 {
                     "fields": "activity",
@@ -133,11 +152,11 @@ References:
             ],
         },
         {
-            "name": "production-exchanges",
-            "path": "production-exchanges.csv.bz2",
+            "name": "use",
+            "path": "use.csv.bz2",
             "profile": "tabular-data-resource",
             "mediatype": "text/csv+bz2",
-            "title": "Diagonal principal production values",
+            "title": "Use table",
             "format": "csv",
             "schema": {
                 "fields": [
@@ -158,12 +177,90 @@ References:
             ],
         },
         {
-            "name": "hiot",
-            "path": "hiot.csv.bz2",
+            "name": "final-demand",
+            "path": "final-demand.csv.bz2",
+            "profile": "tabular-data-resource",
+            "mediatype": "text/csv+bz2",
+            "title": "Final demand",
+            "format": "csv",
+            "schema": {
+                "fields": [
+                    {"name": "product"},
+                    {"name": "category"},
+                    {"name": "value", "type": "number"},
+                ]
+            },
+            "foreignKeys": [
+                {
+                    "fields": "product",
+                    "reference": {"resource": "products", "fields": "id"},
+                },
+                {
+                    "fields": "category",
+                    "reference": {"resource": "final-demand-categories", "fields": "id"},
+                },
+            ],
+        },
+        {
+            "name": "stock-to-waste",
+            "path": "stock-to-waste.csv.bz2",
             "profile": "tabular-data-resource",
             "mediatype": "text/csv+bz2",
-            "title": "Values from Input-Output table (excluding production)",
+            "title": "Stock to waste",
             "format": "csv",
+            "schema": {
+                "fields": [
+                    {"name": "product"},
+                    {"name": "category"},
+                    {"name": "value", "type": "number"},
+                ]
+            },
+            "foreignKeys": [
+                {
+                    "fields": "product",
+                    "reference": {"resource": "products", "fields": "id"},
+                },
+                {
+                    "fields": "category",
+                    "reference": {"resource": "final-demand-categories", "fields": "id"},
+                },
+            ],
+        },
+        # OR (writing the SU tables to scipy.sparse npz files)
+        {
+            "name": "supply",
+            "path": "supply.npz",
+            "profile": "data-resource",
+            "mediatype": "application/octet-stream",
+            "title": "Supply table",
+            "description": "Sparse matrix with one row per product and one column per activity, in the order of their resources",
+            "format": "npz",
+            "schema": {
+                "fields": [
+                    {"name": "product"},
+                    {"name": "activity"},
+                    {"name": "value", "type": "number"},
+                ]
+            },
+            "foreignKeys": [
+                {
+                    "fields": "product",
+                    "reference": {"resource": "products", "fields": "id"},
+                },
+                {
+                    "fields": "activity",
+                    "reference": {"resource": "activities", "fields": "id"},
+                },
+            ],
+        },
+        {
+            "name": "use",
+            "path": "use.npz",
+            "profile": "data-resource",
+            "mediatype": "application/octet-stream",
+            "title": "Use table",
+            "description": "Sparse matrix with one row per product and one column per activity, in the order of their resources",
+            "format": "npz",
             "schema": {
                 "fields": [
                     {"name": "product"},
@@ -182,5 +279,57 @@ References:
                 },
             ],
         },
+        {
+            "name": "final-demand",
+            "path": "final-demand.npz",
+            "profile": "data-resource",
+            "mediatype": "application/octet-stream",
+            "title": "Final demand",
+            "description": "Sparse matrix with one row per product and one column per final demand category, in the order of their resources",
+            "format": "npz",
+            "schema": {
+                "fields": [
+                    {"name": "product"},
+                    {"name": "category"},
+                    {"name": "value", "type": "number"},
+                ]
+            },
+            "foreignKeys": [
+                {
+                    "fields": "product",
+                    "reference": {"resource": "products", "fields": "id"},
+                },
+                {
+                    "fields": "category",
+                    "reference": {"resource": "final-demand-categories", "fields": "id"},
+                },
+            ],
+        },
+        {
+            "name": "stock-to-waste",
+            "path": "stock-to-waste.npz",
+            "profile": "data-resource",
+            "mediatype": "application/octet-stream",
+            "title": "Stock to waste",
+            "description": "Sparse matrix with one row per product and one column per final demand category, in the order of their resources",
+            "format": "npz",
+            "schema": {
+                "fields": [
+                    {"name": "product"},
+                    {"name": "category"},
+                    {"name": "value", "type": "number"},
+                ]
+            },
+            "foreignKeys": [
+                {
+                    "fields": "product",
+                    "reference": {"resource": "products", "fields": "id"},
+                },
+                {
+                    "fields": "category",
+                    "reference": {"resource": "final-demand-categories", "fields": "id"},
+                },
+            ],
+        },
     ],
 }
@@ -1,32 +1,22 @@
+from array import array
 from pathlib import Path
 import bz2
 import csv
 import hashlib
-import pandas as pd
-import pyprind
-import pyxlsb
+import itertools
 
 
-def read_xlsb(filepath, worksheet, pbar_total=None):
+def read_xlsb(filepath, worksheet):
+    import pyxlsb
+
     wb = pyxlsb.open_workbook(str(filepath))
     sheet = wb.get_sheet(worksheet)
-
-    if not pbar_total:
-        return [[o.v for o in row] for row in sheet.rows()]
-    else:
-        def iterate_rows(sheet, bar):
-            for row in sheet.rows():
-                bar.update()
-                yield row
-
-        print("Loading file: ", filepath)
-        bar = pyprind.ProgBar(pbar_total)
-        data = [[o.v for o in row] for row in iterate_rows(sheet, bar)]
-        print(bar)
-        return data
+    return [[o.v for o in row] for row in sheet.rows()]
 
 
 def convert_xlsb(workbook, worksheet, targetdir):
+    import pyxlsb
+
     wb = pyxlsb.open_workbook(workbook)
     sheet = wb.get_sheet(worksheet)
 
@@ -39,18 +29,9 @@ def convert_xlsb(workbook, worksheet, targetdir):
 
 
 def extract_with_pandas(filepath, worksheet):
-    return pd.read_excel(filepath, sheet_name=worksheet).to_dict(orient="records")
+    import pandas as pd
 
-
-def write_compressed_csv(filepath, data):
-    filepath = str(filepath)
-    if not filepath.endswith(".csv.bz2"):
-        filepath += ".csv.bz2"
-
-    with bz2.open(filepath, "wt", newline="") as compressed:
-        writer = csv.writer(compressed)
-        for row in data:
-            writer.writerow(row)
+    return pd.read_excel(filepath, sheet_name=worksheet).to_dict(orient="records")
 
 
 def get_numeric_data_iterator(
@@ -67,8 +48,32 @@ def get_numeric_data_iterator(
                     yield (rows[row_index], cols[col_index], value)
 
 
-def get_headers(data, cols, rows):
-    return [row[-cols:] for row in data[:rows]]
+def build_sparse_matrix(data, rows, cols):
+    """Build a ``scipy.sparse.csr_matrix`` from the rows below the headers of ``data``.
+
+    Row ``i`` of the matrix is ``rows[i]``, and column ``j`` is ``cols[j]``.
+    Like ``get_sparse_numeric_data_iterator``, only one row of cells is held
+    in memory at a time, and only the non-zero values and their column
+    positions are kept, in compact ``array`` buffers."""
+    import numpy as np
+    import scipy.sparse
+
+    positions = range(len(cols))
+    indices, values, indptr = array("q"), array("d"), array("q", [0])
+    for row_data in data:
+        cells = row_data[len(row_data) - len(cols) :]
+        indices.extend(itertools.compress(positions, cells))
+        values.extend(itertools.compress(cells, cells))
+        indptr.append(len(indices))
+    assert len(indptr) == len(rows) + 1
+    return scipy.sparse.csr_matrix(
+        (
+            np.frombuffer(values, dtype=np.float64),
+            np.frombuffer(indices, dtype=np.int64),
+            np.frombuffer(indptr, dtype=np.int64),
+        ),
+        shape=(len(rows), len(cols)),
+    )
 
 
 def md5(filepath, blocksize=65536):
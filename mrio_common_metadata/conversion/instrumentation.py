@@ -0,0 +1,217 @@
+"""Timing, size and memory metrics for conversion stages, with optional profiling.
+
+Each stage is run with ``run_stage``, which returns a dictionary of metrics:
+
+* ``stage``: The stage function name
+* ``wall_time``: Seconds from start to end of the stage
+* ``rows`` and ``cells``: Number of source rows and cells read
+* ``peak_memory``: Peak resident memory in bytes of the process running the
+  stage, or ``None`` if unknown. On Linux, the peak is reset for each stage.
+* ``timings``: Seconds spent in each phase: ``parse`` (reading source
+  files), ``validate`` (checking labels against the metadata), ``compress``
+  (formatting, compressing and writing output files), and ``other``.
+  Stages can add their own phases, e.g. ``hash`` when packaging.
+
+Stage functions get the recorder of the running stage with ``get_recorder``,
+and use it to count rows and attribute time to phases. Metrics are logged
+to the ``mrio_common_metadata.conversion`` logger."""
+from contextlib import contextmanager
+from pathlib import Path
+import logging
+import sys
+import time
+
+
+logger = logging.getLogger("mrio_common_metadata.conversion")
+
+PHASES = ("parse", "validate", "compress")
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+class StageRecorder:
+    """Count rows and cells, and measure the time spent in each phase of a stage.
+
+    Time is attributed to one phase at a time. When a phase starts inside
+    another, e.g. when the writer of the ``compress`` phase pulls a row from
+    a ``parse`` iterator, the outer phase is paused until the inner one ends."""
+
+    def __init__(self, stage=None):
+        self.stage = stage
+        self.rows = 0
+        self.cells = 0
+        self.timings = dict.fromkeys(PHASES, 0.0)
+        self._phases = []
+        self._since = None
+
+    def _switch(self, phase=None):
+        """Enter ``phase``, or leave the current phase if ``phase`` is ``None``"""
+        now = time.perf_counter()
+        if self._phases:
+            current = self._phases[-1]
+            self.timings[current] = self.timings.get(current, 0.0) + now - self._since
+        if phase is None:
+            self._phases.pop()
+        else:
+            self._phases.append(phase)
+        self._since = now
+
+    @contextmanager
+    def phase(self, name):
+        """Attribute the time spent in a ``with`` block to phase ``name``"""
+        self._switch(name)
+        try:
+            yield
+        finally:
+            self._switch()
+
+    def iterate(self, iterable, phase, count=False):
+        """Wrap ``iterable``, attributing the time spent producing items to ``phase``.
+
+        If ``count`` is ``True``, the items are rows of cells, and are added
+        to the row and cell counts."""
+        iterator = iter(iterable)
+        while True:
+            self._switch(phase)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._switch()
+            if count:
+                self.add(1, len(item))
+            yield item
+
+    def add(self, rows=0, cells=0):
+        self.rows += rows
+        self.cells += cells
+
+    def get_metrics(self, wall_time):
+        timings = dict(self.timings)
+        timings["other"] = max(0.0, wall_time - sum(timings.values()))
+        return {
+            "stage": self.stage,
+            "wall_time": wall_time,
+            "rows": self.rows,
+            "cells": self.cells,
+            "peak_memory": get_peak_memory(),
+            "timings": timings,
+        }
+
+
+_recorder = None
+
+
+def get_recorder():
+    """Get the recorder of the running stage, or a new one if no stage is running"""
+    return _recorder if _recorder is not None else StageRecorder()
+
+
+def reset_peak_memory():
+    """Reset the peak resident memory of this process, if possible (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def get_peak_memory():
+    """Get the peak resident memory of this process in bytes, or ``None`` if unknown"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def profiling(name, directory=None, profiler="cprofile"):
+    """Profile a ``with`` block, and write the results to ``directory``.
+
+    ``profiler`` is ``cprofile``, which writes ``name.prof`` for ``pstats``,
+    or ``pyinstrument``, which writes ``name.html``. Does nothing if
+    ``directory`` is ``None``."""
+    if directory is None:
+        yield
+        return
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    if profiler == "cprofile":
+        import cProfile
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(directory / (name + ".prof"))
+    elif profiler == "pyinstrument":
+        try:
+            import pyinstrument
+        except ImportError:
+            raise ImportError("Profiling with pyinstrument requires `pyinstrument`")
+        profile = pyinstrument.Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            with open(directory / (name + ".html"), "w") as f:
+                f.write(profile.output_html())
+    else:
+        raise ValueError(
+            "Unknown profiler {}; use one of {}".format(profiler, PROFILERS)
+        )
+
+
+def run_stage(stage, args, kwargs, profile=None, profiler="cprofile"):
+    """Run ``stage(*args, **kwargs)`` with a new recorder, and return its metrics.
+
+    If ``profile`` is a directory, the stage is profiled (see ``profiling``).
+    Can be run in a worker process."""
+    global _recorder
+    recorder = _recorder = StageRecorder(stage.__name__)
+    reset_peak_memory()
+    start = time.perf_counter()
+    try:
+        with profiling(stage.__name__, profile, profiler):
+            stage(*args, **kwargs)
+    finally:
+        _recorder = None
+    return recorder.get_metrics(time.perf_counter() - start)
+
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return "{:.1f} {}".format(size, unit)
+        size /= 1024
+
+
+def log_metrics(metrics):
+    """Log a one line summary of stage ``metrics``"""
+    logger.info(
+        "%s: %.2f s, %d rows, %d cells, %s written, %s peak memory (%s)",
+        metrics["stage"],
+        metrics["wall_time"],
+        metrics["rows"],
+        metrics["cells"],
+        format_size(metrics.get("bytes_written", 0)),
+        "?" if metrics["peak_memory"] is None else format_size(metrics["peak_memory"]),
+        ", ".join(
+            "{} {:.2f} s".format(phase, seconds)
+            for phase, seconds in metrics["timings"].items()
+        ),
+    )
@@ -0,0 +1,131 @@
+"""Record of completed conversion stages, so interrupted conversions can be resumed.
+
+The manifest is a JSON file in the target directory. For each completed
+stage, it stores the hashes of the files the stage read, the conversion
+parameters, and the hashes of the files the stage wrote. A stage is only
+skipped if all of these are unchanged. The modification time and size of
+each hashed file are stored as well, and files are only hashed again if
+these change."""
+from ..utils import COMPRESSION, md5
+import json
+import os
+
+
+MANIFEST_FILENAME = "conversion-manifest.json"
+
+
+def load_manifest(targetdir):
+    try:
+        with open(targetdir / MANIFEST_FILENAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"stages": {}}
+
+
+def save_manifest(targetdir, manifest):
+    # Write to a temporary file first, so an interruption can't corrupt the manifest
+    filepath = targetdir / (MANIFEST_FILENAME + ".tmp")
+    with open(filepath, "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(filepath, targetdir / MANIFEST_FILENAME)
+
+
+def _hash_file(filepath, stats):
+    """Get the md5 of ``filepath``, or its hash in ``stats`` if it is unchanged"""
+    if stats is None:
+        return md5(filepath)
+    stat = filepath.stat()
+    key = str(filepath.absolute())
+    known = stats.get(key)
+    if known and known[:2] == [stat.st_mtime_ns, stat.st_size]:
+        return known[2]
+    stats[key] = [stat.st_mtime_ns, stat.st_size, md5(filepath)]
+    return stats[key][2]
+
+
+def hash_files(dirpath, filenames, hashes=None, stats=None):
+    """Get ``{filename: md5}`` for ``filenames`` in ``dirpath``.
+
+    Missing files have the hash ``None``. ``hashes`` is an optional dictionary
+    of already computed hashes, which is updated in place. ``stats`` is an
+    optional ``{path: [mtime_ns, size, md5]}`` dictionary, usually
+    ``get_file_stats(manifest)``; files whose modification time and size are
+    unchanged aren't read again."""
+    if hashes is None:
+        hashes = {}
+    for filename in filenames:
+        if filename not in hashes:
+            filepath = dirpath / filename
+            hashes[filename] = (
+                _hash_file(filepath, stats) if filepath.is_file() else None
+            )
+    return {filename: hashes[filename] for filename in filenames}
+
+
+def get_file_stats(manifest):
+    """Get the modification times, sizes and hashes of files hashed for ``manifest``"""
+    return manifest.setdefault("files", {})
+
+
+# Suffixes of the files written for a resource, in any output format
+OUTPUT_SUFFIXES = [".csv" + dct["extension"] for dct in COMPRESSION.values()] + [
+    ".parquet",
+    ".npz",
+    ".npy",
+    ".row-ids.npy",
+    ".col-ids.npy",
+]
+
+
+def get_stage_outputs(targetdir, names):
+    """Get the filenames in ``targetdir`` written for resources ``names``.
+
+    Only the files converters write are matched, in any output format and
+    compression, and not e.g. the cache sidecars of ``hiot``."""
+    filenames = {name + suffix for name in names for suffix in OUTPUT_SUFFIXES}
+    return sorted(
+        pth.name
+        for pth in targetdir.iterdir()
+        if pth.is_file() and pth.name in filenames
+    )
+
+
+def is_stage_current(manifest, targetdir, stage, inputs, parameters, names):
+    """Check if ``stage`` completed with the same inputs and parameters, and its outputs are unchanged"""
+    record = manifest["stages"].get(stage)
+    if not record:
+        return False
+    elif record["inputs"] != inputs or record["parameters"] != parameters:
+        return False
+    outputs = get_stage_outputs(targetdir, names)
+    stats = get_file_stats(manifest)
+    return hash_files(targetdir, outputs, stats=stats) == record["outputs"]
+
+
+def discard_stage(manifest, targetdir, stage, names):
+    """Remove the record and outputs of ``stage`` before it is (re)run.
+
+    A failed run is then never seen as complete, and files written with other
+    parameters, e.g. ``products.csv.bz2`` before a ``zstd`` run, are not left
+    next to the new outputs."""
+    record = manifest["stages"].pop(stage, None)
+    filenames = set(get_stage_outputs(targetdir, names))
+    if record is not None:
+        filenames.update(record["outputs"])
+    for filename in sorted(filenames):
+        (targetdir / filename).unlink(missing_ok=True)
+    if record is not None:
+        save_manifest(targetdir, manifest)
+
+
+def record_stage(manifest, targetdir, stage, inputs, parameters, names):
+    manifest["stages"][stage] = {
+        "inputs": inputs,
+        "parameters": parameters,
+        "outputs": hash_files(
+            targetdir,
+            get_stage_outputs(targetdir, names),
+            stats=get_file_stats(manifest),
+        ),
+    }
+    save_manifest(targetdir, manifest)
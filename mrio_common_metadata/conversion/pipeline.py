@@ -0,0 +1,342 @@
+"""Stage runner and packaging shared by the EXIOBASE converters.
+
+A converter provides its stages, the resources each stage writes
+(``stage_outputs``), a function to list the source files each stage reads
+(``get_stage_sources``), and its datapackage resources; see the hybrid IO
+and SU ``convert_exiobase``."""
+from .instrumentation import get_recorder, log_metrics, logger, run_stage
+from .manifest import (
+    MANIFEST_FILENAME,
+    discard_stage,
+    get_file_stats,
+    get_stage_outputs,
+    hash_files,
+    is_stage_current,
+    load_manifest,
+    record_stage,
+)
+from ..utils import (
+    COMPRESSION,
+    PARQUET_MEDIATYPE,
+    HashingReader,
+    hash_files_in_parallel,
+    load_compressed_csv,
+    load_parquet_as_rows,
+)
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import json
+
+
+def run_conversion(
+    sourcedir,
+    targetdir,
+    version,
+    extract_metadata,
+    stages,
+    package,
+    stage_outputs,
+    get_stage_sources,
+    workers=1,
+    compression="bz2",
+    compresslevel=None,
+    output_format="csv",
+    resume=True,
+    hash="md5",
+    callback=None,
+    profile=None,
+    profiler="cprofile",
+    stage_options=None,
+):
+    """Run the stages of a converter, and package their outputs.
+
+    ``extract_metadata`` runs first, as all other ``stages`` read its
+    outputs. The other stages are then run in order, or concurrently with
+    more than one worker (see ``run_concurrently``). Finally,
+    ``package(targetdir, version, **kwargs)`` writes the archive.
+
+    ``stage_options`` maps stage names to extra keyword arguments, e.g. the
+    table format. Stages are skipped or recorded in the manifest of
+    ``targetdir``, with the options and their own ``stage_options`` as
+    parameters. The other arguments are as in ``convert_exiobase``."""
+
+    # sanitize user input: sourcedir must be path
+    if not isinstance(sourcedir, Path):
+        sourcedir = Path(sourcedir)
+
+    # default target directory = source directory/datapackage
+    if targetdir is None:
+        targetdir = sourcedir / "datapackage"
+        targetdir.mkdir(exist_ok=True)
+    targetdir = Path(targetdir)
+
+    manifest = load_manifest(targetdir) if resume else {"stages": {}}
+    parameters = {
+        "version": version,
+        "compression": compression,
+        "compresslevel": compresslevel,
+        "output_format": output_format,
+    }
+    stage_options = stage_options or {}
+    source_hashes = {}
+
+    def get_parameters(name):
+        return dict(parameters, **stage_options.get(name, {}))
+
+    def get_inputs(stage):
+        inputs = hash_files(
+            sourcedir,
+            get_stage_sources(version, stage.__name__),
+            source_hashes,
+            get_file_stats(manifest),
+        )
+        # all stages except the first also read the metadata
+        if stage is not extract_metadata:
+            name = extract_metadata.__name__
+            inputs.update(manifest["stages"][name]["outputs"])
+        return inputs
+
+    def select_stages(stages):
+        selected = []
+        for stage in stages:
+            name, inputs = stage.__name__, get_inputs(stage)
+            names, params = stage_outputs[name], get_parameters(name)
+            if is_stage_current(manifest, targetdir, name, inputs, params, names):
+                logger.info("Skipping %s: already up to date", name)
+                continue
+            discard_stage(manifest, targetdir, name, names)
+            selected.append((stage, inputs))
+        return selected
+
+    def report(metrics, filenames):
+        metrics["bytes_written"] = sum(
+            (targetdir / filename).stat().st_size for filename in filenames
+        )
+        log_metrics(metrics)
+        if callback is not None:
+            callback(metrics)
+
+    def record(stage, inputs, metrics):
+        name = stage.__name__
+        record_stage(
+            manifest, targetdir, name, inputs, get_parameters(name), stage_outputs[name]
+        )
+        report(metrics, get_stage_outputs(targetdir, stage_outputs[name]))
+
+    def run(stage, args, **kwargs):
+        return run_stage(stage, args, kwargs, profile, profiler)
+
+    # extract data
+    options = {
+        "workers": workers,
+        "compression": compression,
+        "compresslevel": compresslevel,
+        "output_format": output_format,
+    }
+    # metadata is needed by all other stages
+    for stage, inputs in select_stages([extract_metadata]):
+        record(stage, inputs, run(stage, (sourcedir, targetdir, version), **options))
+
+    stages = select_stages(stages)
+    if workers and workers > 1:
+        run_concurrently(
+            stages,
+            (sourcedir, targetdir, version),
+            options,
+            workers,
+            record,
+            profile,
+            profiler,
+            stage_options,
+        )
+    else:
+        for stage, inputs in stages:
+            kwargs = dict(options, **stage_options.get(stage.__name__, {}))
+            record(stage, inputs, run(stage, (sourcedir, targetdir, version), **kwargs))
+
+    # turn files into one datapackage
+    metrics = run(
+        package,
+        (targetdir, version),
+        compression=compression,
+        output_format=output_format,
+        hash=hash,
+        workers=workers,
+    )
+    report(metrics, [get_datafile(targetdir, version).name, "datapackage.json"])
+
+    # print and return path of datapackage
+    print(f"Conversion successful: {targetdir}")
+    return targetdir
+
+
+def run_concurrently(
+    stages,
+    args,
+    options,
+    workers,
+    callback=None,
+    profile=None,
+    profiler="cprofile",
+    stage_options=None,
+):
+    """Run independent ``stages`` on a pool of at most ``workers`` processes.
+
+    ``stages`` is a list of ``(function, inputs)``; ``callback(function,
+    inputs, metrics)`` is called in this process as each stage completes,
+    with the metrics returned by ``run_stage``. Each stage gets ``options``,
+    its extra options in ``stage_options`` if any, and an equal share of the
+    workers for its own use. If a stage fails,
+    stages which have not started are cancelled, running stages are allowed
+    to finish, and the first exception is re-raised here."""
+    if not stages:
+        return
+    processes = min(workers, len(stages))
+    options = dict(options, workers=max(1, workers // processes))
+    stage_options = stage_options or {}
+    errors = []
+    with ProcessPoolExecutor(processes) as executor:
+        futures = {
+            executor.submit(
+                run_stage,
+                stage,
+                args,
+                dict(options, **stage_options.get(stage.__name__, {})),
+                profile,
+                profiler,
+            ): (stage, inputs)
+            for stage, inputs in stages
+        }
+        for future in as_completed(futures):
+            if future.cancelled():
+                continue
+            elif future.exception() is not None:
+                if not errors:
+                    for other in futures:
+                        other.cancel()
+                errors.append(future.exception())
+            elif callback is not None:
+                callback(*futures[future], future.result())
+    if errors:
+        raise errors[0]
+
+
+def write_archive(
+    targetdir, datapackage, datafile, metafile=None, flush=True, hash="md5", workers=1
+):
+    """Add the files in ``targetdir`` to the tar archive ``datafile``.
+
+    Each file is read only once: resource files are hashed while they are
+    copied into the archive, and the ``datapackage`` descriptor is written
+    to ``metafile`` afterwards. With more than one worker, hashing runs in a
+    separate thread, overlapping with reading and writing. Hashes other
+    than ``md5`` are recorded with a prefix, e.g. ``blake2b:...``. If
+    ``flush`` is ``True``, files are deleted once the archive and descriptor
+    are complete. Directories, e.g. of profiles, are left in place.
+
+    The descriptor is also added as the last member of the archive, so the
+    archive can be read in place, e.g. ``list_resources(datafile)``."""
+    import tarfile
+
+    resources = {resource["path"]: resource for resource in datapackage["resources"]}
+    if metafile is None:
+        metafile = targetdir / "datapackage.json"
+
+    executor = None
+    if workers and workers > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(1)
+
+    # add files to tar, hashing resources in the same pass
+    archived = []
+    try:
+        with get_recorder().phase("compress"), tarfile.open(
+            datafile, "w", copybufsize=2 ** 20
+        ) as tar:
+            for pth in sorted(targetdir.iterdir()):
+                if pth in [datafile, metafile] or pth.name == MANIFEST_FILENAME:
+                    continue
+                if not pth.is_file():
+                    continue
+                info = tar.gettarinfo(pth, arcname=pth.name)
+                with open(pth, "rb") as f:
+                    reader = HashingReader(f, hash, executor)
+                    tar.addfile(info, reader)
+                if pth.name in resources:
+                    resources[pth.name]["hash"] = reader.get_hash()
+                archived.append(pth)
+
+            # serialize metadata
+            with open(targetdir / metafile, "w") as f:
+                json.dump(datapackage, f, indent=2, ensure_ascii=False)
+            tar.add(targetdir / metafile, arcname="datapackage.json")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # delete files only once nothing can fail
+    if flush is True:
+        for pth in archived:
+            pth.unlink()
+
+
+def get_datafile(targetdir, version):
+    """Get the default path of the tar archive written by ``package_exiobase``"""
+    return targetdir / "exiobase-{}.tar".format(version.replace(" ", "-"))
+
+
+def select_resources(
+    datapackage,
+    targetdir,
+    compression="bz2",
+    output_format="csv",
+    hash="md5",
+    workers=1,
+):
+    """Fill in the resources of ``datapackage`` for the files in ``targetdir``.
+
+    CSV resources point to files in ``output_format`` and ``compression``,
+    and resources without a file are removed. Resource files are hashed with
+    the algorithm ``hash``, in up to ``workers`` parallel threads. If
+    ``hash`` is ``None``, no hashes are added. ``datapackage`` is modified
+    in place, and returned."""
+
+    # point CSV resources to files with the chosen format and compression
+    for resource in datapackage["resources"]:
+        if resource["format"] != "csv":
+            continue
+        elif output_format == "parquet":
+            resource["path"] = resource["path"].replace(".csv.bz2", ".parquet")
+            resource["mediatype"] = PARQUET_MEDIATYPE
+            resource["format"] = "parquet"
+        else:
+            resource["path"] = resource["path"].replace(
+                ".csv.bz2", ".csv" + COMPRESSION[compression]["extension"]
+            )
+            resource["mediatype"] = COMPRESSION[compression]["mediatype"]
+
+    # delete resource metadata for which no file is present
+    datapackage["resources"] = [
+        r for r in datapackage["resources"] if (targetdir / r["path"]).exists()
+    ]
+
+    # create hash for each resource
+    if hash is not None:
+        with get_recorder().phase("hash"):
+            hashes = hash_files_in_parallel(
+                [targetdir / r["path"] for r in datapackage["resources"]],
+                hash,
+                workers,
+            )
+        for resource, value in zip(datapackage["resources"], hashes):
+            resource["hash"] = value
+
+    return datapackage
+
+
+def load_metadata(kind, targetdir, compression="bz2", output_format="csv"):
+    if output_format == "parquet":
+        return load_parquet_as_rows(targetdir / (kind + ".parquet"))
+    filepath = targetdir / (kind + ".csv" + COMPRESSION[compression]["extension"])
+    return load_compressed_csv(filepath, compression=compression)
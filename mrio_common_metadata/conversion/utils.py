@@ -0,0 +1,168 @@
+"""Worksheet and CSV helpers shared by the EXIOBASE converters."""
+from ..utils import (
+    COMPRESSION,
+    open_compressed,
+    write_multistream_compressed_csv,
+)
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import itertools
+import threading
+
+
+def write_compressed_csv(
+    filepath, data, workers=1, compression="bz2", compresslevel=None
+):
+    """Write rows of ``data`` to ``filepath`` as compressed CSV.
+
+    ``compression`` is one of the codecs in ``COMPRESSION``. With more than
+    one worker, bz2 blocks are compressed in parallel and written as a
+    multi-stream bz2 file, and zstd uses several compression threads."""
+    filepath = str(filepath)
+    extension = ".csv" + COMPRESSION[compression]["extension"]
+    if not filepath.endswith(extension):
+        filepath += extension
+
+    if compression == "bz2" and workers and workers > 1:
+        write_multistream_compressed_csv(filepath, data, workers, compresslevel)
+        return
+
+    with open_compressed(
+        filepath, "wt", compression, compresslevel, workers, newline=""
+    ) as compressed:
+        writer = csv.writer(compressed)
+        writer.writerows(data)
+
+
+def iterate_xlsb(filepath, worksheet):
+    """Iterate over the cell values of a worksheet, one row at a time"""
+    import pyxlsb
+
+    with pyxlsb.open_workbook(str(filepath)) as wb:
+        with wb.get_sheet(worksheet) as sheet:
+            for row in sheet.rows():
+                yield [o.v for o in row]
+
+
+class WorkbookSession:
+    """Open each workbook once, and serve any number of its worksheets.
+
+    Opening a workbook parses its zip directory, workbook index and shared
+    strings table; ``.xlsb`` files are read with ``pyxlsb``, and ``.xlsx``
+    files with ``openpyxl`` in read-only mode. A session keeps workbooks open
+    and reuses this state for every worksheet read from the same file. Use
+    as a context manager, so that all files are closed afterwards."""
+
+    def __init__(self):
+        self._workbooks = {}
+        self._sheets = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def get_workbook(self, filepath):
+        """Open ``filepath``, or return the workbook if it is already open"""
+        filepath = str(filepath)
+        with self._lock:
+            if filepath not in self._workbooks:
+                if filepath.endswith(".xlsb"):
+                    import pyxlsb
+
+                    self._workbooks[filepath] = pyxlsb.open_workbook(filepath)
+                else:
+                    import openpyxl
+
+                    self._workbooks[filepath] = openpyxl.load_workbook(
+                        filepath, read_only=True, data_only=True
+                    )
+            return self._workbooks[filepath]
+
+    def get_sheet(self, filepath, worksheet):
+        """Decompress a ``.xlsb`` worksheet. Can be called from several threads."""
+        sheet = self.get_workbook(filepath).get_sheet(worksheet)
+        with self._lock:
+            self._sheets.append(sheet)
+        return sheet
+
+    def iterate_xlsb(self, filepath, worksheet):
+        """Iterate over the cell values of a worksheet, one row at a time"""
+        return _iterate_sheet_rows(self.get_sheet(filepath, worksheet))
+
+    def iterate_sheets(self, sheets, workers=1):
+        """Get row iterators for a list of ``(filepath, worksheet)`` in ``.xlsb`` files.
+
+        With more than one worker, the worksheets are decompressed in parallel
+        threads; rows are still parsed when the iterators are consumed."""
+        if workers > 1 and len(sheets) > 1:
+            with ThreadPoolExecutor(min(workers, len(sheets))) as executor:
+                opened = list(executor.map(lambda args: self.get_sheet(*args), sheets))
+        else:
+            opened = [self.get_sheet(*args) for args in sheets]
+        return [_iterate_sheet_rows(sheet) for sheet in opened]
+
+    def iterate_columns(self, filepath, worksheet, mapping, fields):
+        """Iterate over selected columns of a ``.xlsx`` worksheet, as tuples.
+
+        The first row holds the column names. ``mapping`` maps column names to
+        field names, and the values of each row are returned in the order of
+        ``fields``. Fields without a column in the worksheet are ``None``, and
+        other columns are not read. Empty rows are skipped."""
+        rows = self.get_workbook(filepath)[worksheet].iter_rows(values_only=True)
+        columns = {
+            mapping[name.strip()]: index
+            for index, name in enumerate(next(rows))
+            if isinstance(name, str) and name.strip() in mapping
+        }
+        indices = [columns.get(field) for field in fields]
+        for row in rows:
+            values = tuple(
+                None if index is None or index >= len(row) else row[index]
+                for index in indices
+            )
+            if any(value is not None for value in values):
+                yield values
+
+    def close(self):
+        for sheet in self._sheets:
+            sheet.close()
+        for workbook in self._workbooks.values():
+            workbook.close()
+        self._sheets, self._workbooks = [], {}
+
+
+def _iterate_sheet_rows(sheet):
+    for row in sheet.rows():
+        yield [o.v for o in row]
+
+
+def split_headers(data, rows):
+    """Return the first ``rows`` rows as a list, and an iterator over the remaining rows"""
+    data = iter(data)
+    return [next(data) for _ in range(rows)], data
+
+
+def get_sparse_numeric_data_iterator(data, rows, cols):
+    """Iterate over ``(row id, col id, value)`` for the non-zero cells of ``data``.
+
+    ``data`` is an iterator over the rows below the headers, so only one row
+    is held in memory at a time. Zero and empty cells are skipped with
+    ``itertools.compress``, instead of testing every cell in Python."""
+    col_ids = [col[0] for col in cols]
+    row_count = 0
+    for row_index, row_data in enumerate(data):
+        values = row_data[len(row_data) - len(cols) :]
+        yield from zip(
+            itertools.repeat(rows[row_index][0]),
+            itertools.compress(col_ids, values),
+            itertools.compress(values, values),
+        )
+        row_count += 1
+    assert row_count == len(rows)
+
+
+def get_headers(data, cols, rows):
+    return [row[-cols:] for row in data[:rows]]
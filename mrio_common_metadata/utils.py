@@ -1,28 +1,194 @@
+from .archive import TarMember, get_byte_range, open_binary
+from collections import deque
 import bz2
 import csv
+import gzip
 import hashlib
+import io
+import itertools
 import json
-import pandas as pd
+import locale
+import mmap
+import re
+
+
+# Start of a bz2 stream, followed by the magic number of its first block
+BZ2_STREAM_HEADER = re.compile(rb"BZh[1-9]1AY&SY")
+
+# Supported compression codecs for CSV resources, with their default levels
+COMPRESSION = {
+    "bz2": {"extension": ".bz2", "mediatype": "text/csv+bz2", "compresslevel": 9},
+    "gzip": {"extension": ".gz", "mediatype": "text/csv+gzip", "compresslevel": 9},
+    "lz4": {"extension": ".lz4", "mediatype": "text/csv+lz4", "compresslevel": 0},
+    "zstd": {"extension": ".zst", "mediatype": "text/csv+zstd", "compresslevel": 3},
+}
+
+
+def get_compression(filepath=None, mediatype=None):
+    """Get the compression codec name from a resource ``mediatype`` or a file extension"""
+    for name, dct in COMPRESSION.items():
+        if mediatype is not None and mediatype == dct["mediatype"]:
+            return name
+        elif mediatype is None and str(filepath).endswith(dct["extension"]):
+            return name
+    raise ValueError(
+        "Unknown compression for {}".format(mediatype if mediatype else filepath)
+    )
+
+PARQUET_MEDIATYPE = "application/vnd.apache.parquet"
+
+
+def get_resource_compression(resource):
+    """Get the compression codec name of a datapackage resource"""
+    return get_compression(resource["path"], resource.get("mediatype"))
+
+
+def open_compressed(
+    filepath, mode="rt", compression=None, compresslevel=None, workers=1, newline=None
+):
+    """Open a compressed file with the codec ``compression``.
+
+    The codec is guessed from the file extension if ``compression`` is not
+    given. ``zstd`` and ``lz4`` need the optional ``zstandard`` and ``lz4``
+    libraries. ``workers`` is only used when writing ``zstd``, which can
+    compress in several threads."""
+    if compression is None:
+        compression = get_compression(filepath)
+    if isinstance(filepath, TarMember):
+        filepath = filepath.open("rb")
+    # an explicit level 0 is valid, e.g. store-only gzip or the zstd default
+    if compresslevel is None and compression in COMPRESSION:
+        compresslevel = COMPRESSION[compression]["compresslevel"]
+
+    if compression == "bz2":
+        return bz2.open(filepath, mode, compresslevel=compresslevel, newline=newline)
+    elif compression == "gzip":
+        return gzip.open(filepath, mode, compresslevel=compresslevel, newline=newline)
+    elif compression == "lz4":
+        try:
+            import lz4.frame
+        except ImportError:
+            raise ImportError("Reading or writing lz4 files requires the `lz4` library")
+        return lz4.frame.open(
+            filepath, mode, compression_level=compresslevel, newline=newline
+        )
+    elif compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                "Reading or writing zstd files requires the `zstandard` library"
+            )
+        cctx = zstandard.ZstdCompressor(
+            level=compresslevel, threads=workers if workers and workers > 1 else 0
+        )
+        return zstandard.open(filepath, mode, cctx=cctx, newline=newline)
+    raise ValueError("Unknown compression: {}".format(compression))
 
 
 def md5(filepath, blocksize=65536):
     """Generate MD5 hash for file at `filepath`"""
     hasher = hashlib.md5()
-    fo = open(filepath, "rb")
-    buf = fo.read(blocksize)
-    while len(buf) > 0:
-        hasher.update(buf)
+    with open_binary(filepath) as fo:
         buf = fo.read(blocksize)
+        while len(buf) > 0:
+            hasher.update(buf)
+            buf = fo.read(blocksize)
     return hasher.hexdigest()
 
 
-def load_compressed_csv(filepath):
-    with bz2.open(filepath, "rt") as compressed:
-        data = list(csv.reader(compressed))
-    return data
+# Hash algorithms for resource files. The fastest depends on the CPU:
+# ``sha256`` uses hardware instructions where available, and ``blake2b`` is
+# fast on 64-bit CPUs without them. ``xxh3_128`` is not cryptographic, but
+# much faster; it needs the optional ``xxhash`` library.
+HASHES = ("md5", "sha256", "blake2b", "xxh3_128")
+
+
+def get_hasher(algorithm="md5"):
+    """Get a new hash object with ``update`` and ``hexdigest`` methods"""
+    if algorithm == "xxh3_128":
+        try:
+            import xxhash
+        except ImportError:
+            raise ImportError("Hashing with xxh3_128 requires the `xxhash` library")
+        return xxhash.xxh3_128()
+    elif algorithm in HASHES:
+        return hashlib.new(algorithm)
+    raise ValueError("Unknown hash algorithm: {}".format(algorithm))
+
+
+def format_hash(hasher, algorithm="md5"):
+    """Format a hash for the datapackage ``hash`` property.
+
+    Following the Data Package specification, MD5 hashes have no prefix, and
+    other hashes are given as ``algorithm:hexdigest``."""
+    if algorithm == "md5":
+        return hasher.hexdigest()
+    return "{}:{}".format(algorithm, hasher.hexdigest())
+
+
+def hash_file(filepath, algorithm="md5", blocksize=2 ** 20):
+    """Hash the file at ``filepath``, and format it like ``format_hash``"""
+    hasher = get_hasher(algorithm)
+    with open_binary(filepath) as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            hasher.update(block)
+    return format_hash(hasher, algorithm)
+
+
+def hash_files_in_parallel(filepaths, algorithm="md5", workers=1):
+    """Hash ``filepaths`` like ``hash_file``, using up to ``workers`` threads.
+
+    The hash functions release the GIL, so the files are read and hashed
+    concurrently."""
+    if workers > 1 and len(filepaths) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(min(workers, len(filepaths))) as executor:
+            return list(executor.map(lambda fp: hash_file(fp, algorithm), filepaths))
+    return [hash_file(filepath, algorithm) for filepath in filepaths]
+
+
+class HashingReader:
+    """Read from a binary file, and hash all data as it is read.
+
+    Used to hash a file in the same pass as it is copied, e.g. into a tar
+    archive. If ``executor`` is given, hashing runs in its (single) thread,
+    overlapping with the caller's reading and writing; at most ``prefetch``
+    blocks wait to be hashed."""
+
+    def __init__(self, fileobj, algorithm="md5", executor=None, prefetch=4):
+        self.fileobj = fileobj
+        self.algorithm = algorithm
+        self.hasher = get_hasher(algorithm)
+        self.executor = executor
+        self.prefetch = prefetch
+        self._pending = deque()
+
+    def read(self, size=-1):
+        block = self.fileobj.read(size)
+        if self.executor is None:
+            self.hasher.update(block)
+        else:
+            if len(self._pending) >= self.prefetch:
+                self._pending.popleft().result()
+            self._pending.append(self.executor.submit(self.hasher.update, block))
+        return block
+
+    def get_hash(self):
+        """Wait for pending blocks, and return the formatted hash of the data read"""
+        while self._pending:
+            self._pending.popleft().result()
+        return format_hash(self.hasher, self.algorithm)
+
+
+def load_compressed_csv(filepath, workers=1, compression=None):
+    return list(iterate_compressed_csv(filepath, workers, compression))
 
 
 def load_compressed_csv_as_dataframe(filepath, exiobase_metadata=None):
+    import pandas as pd
+
     data = load_compressed_csv(filepath)
     if not exiobase_metadata:
         exiobase_metadata = json.load(open(filepath, "r"))
@@ -33,7 +199,496 @@ def load_compressed_csv_as_dataframe(filepath, exiobase_metadata=None):
     return df
 
 
-def iterate_compressed_csv(filepath):
-    with bz2.open(filepath, "rt") as compressed:
+def iterate_compressed_csv(filepath, workers=1, compression=None):
+    """Iterate over the rows of a compressed CSV file.
+
+    ``compression`` is the codec name, and is guessed from the file extension
+    if not given. With more than one worker, multi-stream bz2 files are
+    decompressed and parsed in parallel; see ``iterate_multistream_compressed_csv``."""
+    if compression is None:
+        compression = get_compression(filepath)
+    if compression == "bz2" and workers and workers > 1:
+        yield from iterate_multistream_compressed_csv(filepath, workers)
+        return
+    with open_compressed(filepath, "rt", compression) as compressed:
         for row in csv.reader(compressed):
             yield row
+
+
+def _get_id_lookup(index):
+    """Turn ``{id: position}`` into a ``pandas.Index`` of ids and their positions"""
+    import numpy as np
+    import pandas as pd
+
+    return (
+        pd.Index(list(index), dtype=object),
+        np.fromiter(index.values(), dtype=np.int64, count=len(index)),
+    )
+
+
+def _translate_ids(ids, lookup):
+    """Translate an array of ids to positions, raising ``KeyError`` for unknown ids"""
+    labels, positions = lookup
+    indexer = labels.get_indexer(ids)
+    missing = indexer < 0
+    if missing.any():
+        raise KeyError(ids[missing.argmax()])
+    return positions[indexer]
+
+
+def _translate_categorical(column, lookup):
+    """Translate a categorical ``pandas.Series`` of ids, once per distinct id"""
+    categories = column.cat.categories.to_numpy(dtype=object)
+    return _translate_ids(categories, lookup)[column.cat.codes.to_numpy()]
+
+
+def iterate_compressed_csv_as_arrays(
+    filepath, row_index, col_index, workers=1, compression=None, chunksize=2 ** 16
+):
+    """Iterate over chunks of ``(row, col, value)`` CSV triples as arrays.
+
+    ``row_index`` and ``col_index`` map row and column ids to integer positions.
+    Each chunk is parsed in bulk by the ``pandas`` C parser, and ids are read
+    as categoricals and translated once per distinct id, instead of building
+    a Python ``float`` and tuple for every value. Values are parsed exactly like ``float``. With
+    more than one worker, multi-stream bz2 files are read with
+    ``iterate_multistream_compressed_csv``, and converted one chunk at a time."""
+    import numpy as np
+    import pandas as pd
+
+    rows, cols = _get_id_lookup(row_index), _get_id_lookup(col_index)
+
+    if compression is None:
+        compression = get_compression(filepath)
+    if compression == "bz2" and workers and workers > 1:
+        data = iterate_multistream_compressed_csv(filepath, workers)
+        while True:
+            chunk = list(itertools.islice(data, chunksize))
+            if not chunk:
+                return
+            row_ids, col_ids, values = zip(*chunk)
+            yield (
+                _translate_ids(np.array(row_ids, dtype=object), rows),
+                _translate_ids(np.array(col_ids, dtype=object), cols),
+                np.fromiter(map(float, values), dtype=np.float64, count=len(values)),
+            )
+
+    with open_compressed(filepath, "rt", compression, newline="") as compressed:
+        try:
+            reader = pd.read_csv(
+                compressed,
+                header=None,
+                names=["row", "col", "value"],
+                dtype={"row": "category", "col": "category", "value": np.float64},
+                na_filter=False,
+                float_precision="round_trip",
+                chunksize=chunksize,
+            )
+        except pd.errors.EmptyDataError:
+            return
+        with reader:
+            for chunk in reader:
+                yield (
+                    _translate_categorical(chunk["row"], rows),
+                    _translate_categorical(chunk["col"], cols),
+                    chunk["value"].to_numpy(),
+                )
+
+
+def load_compressed_csv_as_arrays(
+    filepath, row_index, col_index, workers=1, compression=None
+):
+    """Load ``(row, col, value)`` CSV triples as integer and float arrays.
+
+    ``row_index`` and ``col_index`` map row and column ids to integer positions."""
+    import numpy as np
+
+    chunks = list(
+        iterate_compressed_csv_as_arrays(
+            filepath, row_index, col_index, workers, compression
+        )
+    )
+    if not chunks:
+        return (
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float64),
+        )
+    return tuple(np.concatenate(arrays) for arrays in zip(*chunks))
+
+
+def _iterate_ordered_results(executor, func, arguments, prefetch):
+    """Apply ``func`` to each tuple in ``arguments`` on ``executor``, yielding results in order.
+
+    At most ``prefetch`` tasks are in flight, which bounds memory use."""
+    pending = deque()
+    for args in arguments:
+        pending.append(executor.submit(func, *args))
+        if len(pending) >= prefetch:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _iterate_csv_blocks(data, blocksize):
+    """Serialize rows to CSV text, yielding blocks of about ``blocksize`` characters.
+
+    Blocks always end on a row boundary."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in data:
+        writer.writerow(row)
+        if buffer.tell() >= blocksize:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def write_multistream_compressed_csv(
+    filepath, data, workers, compresslevel=None, blocksize=8 * 900000
+):
+    """Write rows to a bz2-compressed CSV file, compressing blocks on ``workers`` processes.
+
+    Each block is compressed as an independent bz2 stream, and the streams
+    are concatenated in order. The result is a standard multi-stream bz2 file
+    which can be read by ``bz2.open``, ``bzip2`` and ``pbzip2``."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    if compresslevel is None:
+        compresslevel = COMPRESSION["bz2"]["compresslevel"]
+    # Same text encoding as ``bz2.open(filepath, "wt")``
+    encoding = locale.getpreferredencoding(False)
+    with open(filepath, "wb") as f, ProcessPoolExecutor(workers) as executor:
+        for compressed in _iterate_ordered_results(
+            executor,
+            bz2.compress,
+            (
+                (block.encode(encoding), compresslevel)
+                for block in _iterate_csv_blocks(data, blocksize)
+            ),
+            2 * workers,
+        ):
+            f.write(compressed)
+
+
+def find_bz2_segments(filepath, min_size=2 ** 20):
+    """Split a multi-stream bz2 file into ``(start, end)`` byte ranges.
+
+    Each range starts at the beginning of a bz2 stream, and consecutive
+    streams are merged until a range is at least ``min_size`` bytes long.
+    Single-stream files give one range. ``filepath`` can be a ``TarMember``."""
+    filepath, start, size = get_byte_range(filepath)
+    if not size:
+        return []
+    with open(filepath, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offsets = [
+                match.start() - start
+                for match in BZ2_STREAM_HEADER.finditer(mm, start, start + size)
+            ]
+
+    if not offsets or offsets[0] != 0:
+        return [(0, size)]
+
+    segments, start = [], 0
+    for offset in offsets[1:] + [size]:
+        if offset - start >= min_size or offset == size:
+            segments.append((start, offset))
+            start = offset
+    return segments
+
+
+def _decompress_csv_segment(filepath, start, end, encoding):
+    """Decompress one byte range and parse its complete CSV lines.
+
+    Returns ``(head, rows, tail)``. ``head`` is the text up to and including
+    the first newline, and ``tail`` the text after the last newline; both
+    can belong to rows which started or continue in a neighbouring range.
+    ``tail`` is ``None`` if the range contains no newline at all."""
+    with open_binary(filepath) as f:
+        f.seek(start)
+        data = bz2.decompress(f.read(end - start))
+
+    first, last = data.find(b"\n"), data.rfind(b"\n")
+    if first == -1:
+        return data, [], None
+    body = data[first + 1 : last + 1].decode(encoding)
+    return (
+        data[: first + 1],
+        list(csv.reader(io.StringIO(body, newline=""))),
+        data[last + 1 :],
+    )
+
+
+def iterate_multistream_compressed_csv(filepath, workers, min_size=2 ** 20):
+    """Iterate over the rows of a bz2-compressed CSV file, decompressing on ``workers`` processes.
+
+    The file is split at bz2 stream boundaries, and the ranges are decompressed
+    and parsed in parallel. Rows are yielded in their original order. Files
+    with only one stream, like those written by ``bz2.open``, are read by a
+    single worker. Quoted fields containing line breaks are not supported."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    encoding = locale.getpreferredencoding(False)
+
+    def parse(text):
+        return csv.reader(io.StringIO(text.decode(encoding), newline=""))
+
+    with ProcessPoolExecutor(workers) as executor:
+        carry = b""
+        for head, rows, tail in _iterate_ordered_results(
+            executor,
+            _decompress_csv_segment,
+            (
+                (filepath, start, end, encoding)
+                for start, end in find_bz2_segments(filepath, min_size)
+            ),
+            2 * workers,
+        ):
+            if tail is None:
+                carry += head
+                continue
+            yield from parse(carry + head)
+            yield from rows
+            carry = tail
+    if carry:
+        yield from parse(carry)
+
+
+def _import_parquet():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Reading or writing Parquet files requires the `pyarrow` library"
+        )
+    return pyarrow, pyarrow.parquet
+
+
+def _get_parquet_schema(fields):
+    """Arrow schema for datapackage ``fields``.
+
+    Numeric fields are stored as float64, and all other fields as
+    dictionary-encoded strings."""
+    pa, _ = _import_parquet()
+    return pa.schema(
+        [
+            pa.field(
+                field["name"],
+                pa.float64()
+                if field.get("type") == "number"
+                else pa.dictionary(pa.int32(), pa.string()),
+            )
+            for field in fields
+        ]
+    )
+
+
+def write_parquet(filepath, data, fields, batchsize=2 ** 20):
+    """Write rows of ``data`` to a Parquet file, in row groups of ``batchsize`` rows.
+
+    ``fields`` are the schema fields from the datapackage descriptor."""
+    pa, pq = _import_parquet()
+    schema = _get_parquet_schema(fields)
+
+    def to_batch(rows):
+        arrays = []
+        for field, column in zip(schema, zip(*rows)):
+            if pa.types.is_dictionary(field.type):
+                column = [None if value is None else str(value) for value in column]
+                arrays.append(pa.array(column, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(column, type=field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    with pq.ParquetWriter(str(filepath), schema) as writer:
+        rows = []
+        for row in data:
+            rows.append(row)
+            if len(rows) >= batchsize:
+                writer.write_batch(to_batch(rows))
+                rows = []
+        if rows:
+            writer.write_batch(to_batch(rows))
+
+
+def write_parquet_matrix(filepath, matrix, row_labels, col_labels, fields):
+    """Write the non-zero values of a ``scipy.sparse`` matrix to a Parquet file.
+
+    Row and column indices are used directly as dictionary codes into
+    ``row_labels`` and ``col_labels``, so no per-element Python objects are created."""
+    import numpy as np
+
+    pa, pq = _import_parquet()
+    matrix = matrix.tocoo()
+
+    def encode(codes, labels):
+        return pa.DictionaryArray.from_arrays(
+            pa.array(codes.astype(np.int32)), pa.array(labels, type=pa.string())
+        )
+
+    arrays = [
+        encode(matrix.row, row_labels),
+        encode(matrix.col, col_labels),
+        pa.array(matrix.data.astype(np.float64)),
+    ]
+    table = pa.Table.from_arrays(arrays, schema=_get_parquet_schema(fields))
+    pq.write_table(table, str(filepath))
+
+
+def load_parquet(filepath, columns=None, filters=None):
+    """Load a Parquet file as a ``pyarrow.Table``.
+
+    ``filters`` are pushed down to the Parquet reader; see ``pyarrow.parquet.read_table``.
+    Members of tar archives are memory-mapped, and read without copying."""
+    pa, pq = _import_parquet()
+    if isinstance(filepath, TarMember):
+        archive, offset, size = get_byte_range(filepath)
+        with pa.memory_map(str(archive)) as mm:
+            source = pa.BufferReader(mm.read_at(size, offset))
+            return pq.read_table(source, columns=columns, filters=filters)
+    return pq.read_table(str(filepath), columns=columns, filters=filters)
+
+
+def load_parquet_as_rows(filepath):
+    """Load the rows of a Parquet file as tuples.
+
+    Missing strings are returned as ``""``, as they are read from CSV files,
+    so metadata is the same for both output formats."""
+    pa, _ = _import_parquet()
+    table = load_parquet(filepath)
+    columns = []
+    for column in table.columns:
+        values = column.to_pylist()
+        value_type = column.type
+        if pa.types.is_dictionary(value_type):
+            value_type = value_type.value_type
+        if pa.types.is_string(value_type) or pa.types.is_large_string(value_type):
+            values = ["" if value is None else value for value in values]
+        columns.append(values)
+    return list(zip(*columns))
+
+
+def load_parquet_as_arrays(filepath, row_index, col_index):
+    """Load a Parquet file of ``(row, col, value)`` as integer and float arrays.
+
+    ``row_index`` and ``col_index`` map row and column ids to integer positions.
+    Ids are translated once per dictionary entry instead of once per value."""
+    import numpy as np
+
+    pa, _ = _import_parquet()
+    table = load_parquet(filepath)
+
+    def positions(column, index):
+        result = []
+        for chunk in column.chunks:
+            if not pa.types.is_dictionary(chunk.type):
+                chunk = chunk.dictionary_encode()
+            mapping = np.array(
+                [index[label] for label in chunk.dictionary.to_pylist()], dtype=np.int64
+            )
+            result.append(mapping[chunk.indices.to_numpy(zero_copy_only=False)])
+        return np.concatenate(result) if result else np.zeros(0, dtype=np.int64)
+
+    return (
+        positions(table.column(0), row_index),
+        positions(table.column(1), col_index),
+        table.column(2).to_numpy().astype(np.float64),
+    )
+
+
+def open_dense_matrix(filepath, shape):
+    """Create a ``.npy`` file of float64 zeros, and memory-map it for writing"""
+    import numpy as np
+
+    return np.lib.format.open_memmap(
+        str(filepath), mode="w+", dtype=np.float64, shape=shape
+    )
+
+
+def get_label_filepaths(filepath):
+    """Get the filepaths of the row and column id sidecars of a ``.npy`` matrix"""
+    if isinstance(filepath, TarMember):
+        stem = filepath.name[: -len(".npy")]
+        return filepath.parent / (stem + ".row-ids.npy"), filepath.parent / (
+            stem + ".col-ids.npy"
+        )
+    stem = str(filepath)[: -len(".npy")]
+    return stem + ".row-ids.npy", stem + ".col-ids.npy"
+
+
+def write_dense_matrix_labels(filepath, row_labels, col_labels):
+    """Write the row and column ids of a ``.npy`` matrix to sidecar ``.npy`` files"""
+    import numpy as np
+
+    for sidecar, labels in zip(get_label_filepaths(filepath), (row_labels, col_labels)):
+        np.save(sidecar, np.array(labels, dtype=str))
+
+
+def load_npy(filepath, mmap_mode=None):
+    """Load a ``.npy`` file like ``numpy.load``; ``filepath`` can be a ``TarMember``.
+
+    Archive members are memory-mapped at their offset in the archive, so only
+    the read-only modes ``r`` and ``c`` (copy-on-write) are allowed."""
+    import numpy as np
+
+    if not isinstance(filepath, TarMember):
+        return np.load(str(filepath), mmap_mode=mmap_mode)
+    elif mmap_mode not in (None, "r", "c"):
+        raise ValueError("Archive members can't be memory-mapped for writing")
+
+    with filepath.open("rb") as f:
+        version = np.lib.format.read_magic(f)
+        if not mmap_mode or version not in ((1, 0), (2, 0)):
+            f.seek(0)
+            return np.load(f)
+        elif version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        header_size = f.tell()
+    return np.memmap(
+        filepath.archive,
+        dtype=dtype,
+        mode=mmap_mode,
+        offset=filepath.offset + header_size,
+        shape=shape,
+        order="F" if fortran_order else "C",
+    )
+
+
+def load_dense_matrix(filepath, mmap_mode="r"):
+    """Load a ``.npy`` matrix and its row and column ids.
+
+    With ``mmap_mode``, the files are memory-mapped instead of read, so
+    several processes can share one copy in the page cache."""
+    return tuple(
+        load_npy(fp, mmap_mode)
+        for fp in (filepath,) + get_label_filepaths(filepath)
+    )
+
+
+def load_sparse_matrix(filepath):
+    """Load a ``scipy.sparse`` matrix from an ``.npz`` file or ``TarMember``"""
+    import scipy.sparse
+
+    with open_binary(filepath) as f:
+        return scipy.sparse.load_npz(f)
+
+
+def load_matrix_as_arrays(filepath):
+    """Load the non-zero values of a ``.npy`` or ``.npz`` matrix.
+
+    Returns ``(rows, cols, values)`` arrays."""
+    if str(filepath).endswith(".npz"):
+        matrix = load_sparse_matrix(filepath).tocoo()
+        return matrix.row, matrix.col, matrix.data
+
+    import numpy as np
+
+    matrix = load_npy(filepath, mmap_mode="r")
+    rows, cols = np.nonzero(matrix)
+    return rows, cols, np.asarray(matrix[rows, cols], dtype=np.float64)
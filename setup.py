@@ -3,8 +3,8 @@ from os import path
 
 here = path.abspath(path.dirname(__file__))
 
-requirements = ['pyxlsb', 'xlrd', 'pandas', 'openpyxl', 'scipy']
-test_requirements = ['pytest']
+requirements = ['pyxlsb', 'xlrd', 'numpy', 'pandas', 'openpyxl', 'scipy']
+test_requirements = ['pytest', 'pytest-benchmark']
 
 v_temp = {}
 with open("mrio_common_metadata/version.py") as fp:
@@ -22,6 +22,12 @@ setup(
     # Only if you have non-python data (CSV, etc.). Might need to change the directory name as well.
     # package_data={'your_name_here': package_files(os.path.join('bw_exiobase', 'data'))},
     install_requires=requirements,
+    extras_require={
+        "zstd": ["zstandard"],
+        "lz4": ["lz4"],
+        "parquet": ["pyarrow"],
+        "xxhash": ["xxhash"],
+    },
     url="https://github.com/brightway-lca/mrio_common_metadata",
     long_description_content_type='text/markdown',
     long_description=open('README.md').read(),
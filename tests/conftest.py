@@ -0,0 +1,47 @@
+"""Small synthetic datapackages for the tests, from ``benchmarks/synthetic.py``."""
+from pathlib import Path
+import shutil
+import sys
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "benchmarks"))
+
+VERSION = "3.3.17 hybrid"
+SIZES = {"regions": 2, "products": 6, "extensions": 4, "density": 0.3, "seed": 0}
+
+
+@pytest.fixture(scope="session")
+def datapackage(tmp_path_factory):
+    """A hybrid IO datapackage directory with CSV resources. Don't modify it."""
+    from synthetic import generate_datapackage
+
+    return generate_datapackage(tmp_path_factory.mktemp("datapackage"), **SIZES)
+
+
+@pytest.fixture
+def datapackage_copy(datapackage, tmp_path):
+    """A copy of ``datapackage`` which can be modified"""
+    return Path(shutil.copytree(datapackage, tmp_path / "datapackage"))
+
+
+@pytest.fixture(scope="session")
+def archive(datapackage, tmp_path_factory):
+    """The tar archive of ``datapackage`` written by ``package_exiobase``"""
+    from mrio_common_metadata.conversion.exiobase_3_hybrid_io import package_exiobase
+    from mrio_common_metadata.conversion.pipeline import get_datafile
+
+    targetdir = Path(
+        shutil.copytree(datapackage, tmp_path_factory.mktemp("archive") / "dp")
+    )
+    package_exiobase(targetdir, VERSION)
+    return get_datafile(targetdir, VERSION)
+
+
+@pytest.fixture(scope="session")
+def io_sources(tmp_path_factory):
+    """A directory of hybrid IO source files"""
+    from synthetic import generate_io_sources
+
+    sourcedir = tmp_path_factory.mktemp("sources")
+    generate_io_sources(sourcedir, VERSION, **SIZES)
+    return sourcedir
@@ -0,0 +1,32 @@
+import mrio_common_metadata as mcm
+from mrio_common_metadata.archive import TarPackage
+
+
+def test_members_match_files(datapackage, archive):
+    package = TarPackage(archive)
+    for filepath in sorted(datapackage.iterdir()):
+        member = package / filepath.name
+        assert member.is_file()
+        with member.open("rb") as f:
+            assert f.read() == filepath.read_bytes()
+
+    with (package / "products.csv.bz2").open("rb") as f:
+        f.seek(10)
+        assert f.read(20) == (datapackage / "products.csv.bz2").read_bytes()[10:30]
+    assert not (package / "missing.csv").is_file()
+
+
+def test_readers_match_directory(datapackage, archive):
+    assert mcm.list_resources(archive) == mcm.list_resources(datapackage)
+    for name in ("products", "activities", "extensions"):
+        assert mcm.get_metadata_resource(archive, name) == mcm.get_metadata_resource(
+            datapackage, name
+        )
+    for name in ("hiot", "extension-exchanges"):
+        assert list(mcm.get_numeric_data_iterator(archive, name)) == list(
+            mcm.get_numeric_data_iterator(datapackage, name)
+        )
+        assert (
+            mcm.get_sparse_matrix(archive, name)[0]
+            != mcm.get_sparse_matrix(datapackage, name)[0]
+        ).nnz == 0
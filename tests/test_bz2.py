@@ -0,0 +1,66 @@
+import bz2
+import csv
+import io
+from mrio_common_metadata.utils import (
+    find_bz2_segments,
+    iterate_compressed_csv,
+    iterate_multistream_compressed_csv,
+    write_multistream_compressed_csv,
+)
+
+ROWS = [["row {}".format(i), "x" * (i % 7), str(i * 0.5)] for i in range(200)]
+
+
+def get_text(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def write_streams(filepath, text, cuts):
+    """Compress the parts of ``text`` between ``cuts`` as separate bz2 streams"""
+    bounds = [0] + cuts + [len(text)]
+    with open(filepath, "wb") as f:
+        for start, end in zip(bounds, bounds[1:]):
+            f.write(bz2.compress(text[start:end]))
+
+
+def test_rows_split_across_streams(tmp_path):
+    text = get_text(ROWS)
+    # cut in the middle of rows, and make one stream without any line break
+    middle = text.index(b"row 100") + 3
+    cuts = [text.index(b"row 10") + 2, middle, middle + 2, text.rindex(b"\n") - 1]
+    filepath = tmp_path / "split.csv.bz2"
+    write_streams(filepath, text, cuts)
+
+    assert len(find_bz2_segments(filepath, min_size=1)) == len(cuts) + 1
+    assert list(iterate_multistream_compressed_csv(filepath, 2, min_size=1)) == ROWS
+
+
+def test_segments_are_merged_to_min_size(tmp_path):
+    filepath = tmp_path / "split.csv.bz2"
+    write_streams(filepath, get_text(ROWS), [100, 200, 300])
+    size = filepath.stat().st_size
+
+    assert find_bz2_segments(filepath, min_size=size) == [(0, size)]
+    segments = find_bz2_segments(filepath, min_size=1)
+    assert segments[0][0] == 0 and segments[-1][1] == size
+    assert all(a[1] == b[0] for a, b in zip(segments, segments[1:]))
+
+
+def test_write_multistream_roundtrip(tmp_path):
+    filepath = tmp_path / "multi.csv.bz2"
+    write_multistream_compressed_csv(filepath, ROWS, 2, blocksize=500)
+
+    assert len(find_bz2_segments(filepath, min_size=1)) > 1
+    with bz2.open(filepath, "rt", newline="") as f:
+        assert list(csv.reader(f)) == ROWS
+    assert list(iterate_compressed_csv(filepath, workers=2)) == ROWS
+
+
+def test_single_stream_is_read_whole(tmp_path):
+    filepath = tmp_path / "single.csv.bz2"
+    filepath.write_bytes(bz2.compress(get_text(ROWS)))
+
+    assert find_bz2_segments(filepath, min_size=1) == [(0, filepath.stat().st_size)]
+    assert list(iterate_multistream_compressed_csv(filepath, 2, min_size=1)) == ROWS
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import mrio_common_metadata as mcm
+
+
+def get_values(dirpath, resource, axis, id):
+    """Get ``{other id: value}`` for one row or column, from a full iteration"""
+    return {
+        elem[1 - axis]["id"]: value
+        for *elem, value in mcm.get_numeric_data_iterator(dirpath, resource)
+        if elem[axis]["id"] == id
+    }
+
+
+@pytest.mark.parametrize("resource", ["hiot", "extension-exchanges"])
+def test_rows_and_columns(datapackage_copy, resource):
+    matrix, row_labels, col_labels = mcm.get_sparse_matrix(datapackage_copy, resource)
+    for id in row_labels.tolist():
+        row = mcm.get_row(datapackage_copy, resource, id)
+        assert {record["id"]: value for record, value in row} == get_values(
+            datapackage_copy, resource, 0, id
+        )
+    for id in col_labels.tolist():
+        column = mcm.get_column(datapackage_copy, resource, id)
+        assert {record["id"]: value for record, value in column} == get_values(
+            datapackage_copy, resource, 1, id
+        )
+    rows = [mcm.get_row(datapackage_copy, resource, id) for id in row_labels.tolist()]
+    assert sum(map(len, rows)) == matrix.nnz
+
+
+def test_unknown_id(datapackage_copy):
+    with pytest.raises(KeyError):
+        mcm.get_row(datapackage_copy, "hiot", "no such product")
+
+
+@pytest.mark.parametrize("solver", ["lu", "iterative"])
+def test_leontief_model(datapackage, solver):
+    model = mcm.get_leontief_model(datapackage, solver=solver)
+    Z = mcm.get_dense_matrix(datapackage, "hiot")[0]
+    x = np.diag(mcm.get_dense_matrix(datapackage, "production-exchanges")[0])
+    F = mcm.get_dense_matrix(datapackage, "extension-exchanges")[0]
+    A, B = Z / x, F / x
+    demand = np.random.default_rng(0).random((len(x), 3))
+
+    expected = B @ np.linalg.solve(np.eye(len(x)) - A, demand)
+    assert np.allclose(model.calculate(demand, batchsize=2), expected)
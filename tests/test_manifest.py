@@ -0,0 +1,56 @@
+import json
+import pytest
+from mrio_common_metadata.conversion import exiobase_3_hybrid_io as hybrid_io
+from mrio_common_metadata.conversion.manifest import MANIFEST_FILENAME
+
+
+def extract_io_exchanges(*args, **kwargs):
+    """Stand-in for the last conversion stage, which is interrupted"""
+    raise RuntimeError("Stage failed")
+
+
+def convert(sourcedir, targetdir, **kwargs):
+    """Run a conversion, and return the names of the stages which ran"""
+    stages = []
+    hybrid_io.convert_exiobase(
+        sourcedir,
+        targetdir,
+        callback=lambda metrics: stages.append(metrics["stage"]),
+        **kwargs,
+    )
+    return stages
+
+
+def convert_with_failure(sourcedir, targetdir, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(hybrid_io, "extract_io_exchanges", extract_io_exchanges)
+        with pytest.raises(RuntimeError):
+            convert(sourcedir, targetdir)
+    manifest = json.loads((targetdir / MANIFEST_FILENAME).read_text())
+    assert "extract_io_exchanges" not in manifest["stages"]
+    assert "extract_production_exchanges" in manifest["stages"]
+
+
+def test_resume_skips_completed_stages(io_sources, tmp_path, monkeypatch):
+    convert_with_failure(io_sources, tmp_path, monkeypatch)
+    # a stage is run again if one of its outputs is missing
+    (tmp_path / "extension-exchanges.csv.bz2").unlink()
+
+    assert convert(io_sources, tmp_path) == [
+        "extract_extension_exchanges",
+        "extract_io_exchanges",
+        "package_exiobase",
+    ]
+    assert (tmp_path / "exiobase-3.3.17-hybrid.tar").is_file()
+
+
+def test_changed_parameters_run_all_stages(io_sources, tmp_path, monkeypatch):
+    convert_with_failure(io_sources, tmp_path, monkeypatch)
+
+    assert convert(io_sources, tmp_path, compresslevel=1) == [
+        "extract_metadata",
+        "extract_extension_exchanges",
+        "extract_production_exchanges",
+        "extract_io_exchanges",
+        "package_exiobase",
+    ]